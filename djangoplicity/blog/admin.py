@@ -28,19 +28,112 @@
 # IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE
+import json
+
 from django.conf import settings
+from django.conf.urls import url
 from django.contrib import admin
-from django.core.urlresolvers import reverse
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
+from django.core.urlresolvers import reverse_lazy
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.http import HttpResponseNotAllowed, JsonResponse
+from django.utils.functional import cached_property
 from django.utils.html import format_html
+from django.utils.translation import ugettext_lazy as _
 
 from djangoplicity.archives.contrib.admin.defaults import RenameAdmin, TranslationDuplicateAdmin, SyncTranslationAdmin, \
     ArchiveAdmin
 from djangoplicity.contrib import admin as dpadmin
+from djangoplicity.media.models import Image
 
 from djangoplicity.blog.models import Author, AuthorDescription, Category, Post, PostProxy, Tag
+from djangoplicity.blog.search import get_backend
+from djangoplicity.blog.utils import url_builder
+from djangoplicity.blog.validators import check_template
+from djangoplicity.blog.widgets import AutocompleteSelect, AutocompleteSelectMultiple
 from djangoplicity.contrib.admin import CleanHTMLAdmin
 from modeltranslation.admin import TranslationAdmin
 
+# Changelist mode for large archives: the authors and tags filters take a
+# typed in prefix instead of listing all the choices, and the number of
+# posts is estimated on PostgreSQL
+ADMIN_HIGH_VOLUME = getattr(settings, 'BLOG_ADMIN_HIGH_VOLUME', False)
+# Below this estimate the posts are counted exactly
+ESTIMATED_COUNT_THRESHOLD = getattr(settings, 'BLOG_ADMIN_ESTIMATED_COUNT_THRESHOLD', 10000)
+
+# Objects searched by the autocompletion of the post change form, by
+# prefix of the given fields (indexed, see migration 0016)
+AUTOCOMPLETE_LOOKUPS = {
+    'author': (Author, ('name', )),
+    'category': (Category, ('name', )),
+    'image': (Image, ('id', 'title')),
+    'tag': (Tag, ('name', )),
+}
+AUTOCOMPLETE_PAGE_SIZE = 20
+
+
+def autocomplete_url(admin_site, model, lookup):
+    opts = model._meta
+    return reverse_lazy('%s:%s_%s_autocomplete' % (admin_site.name, opts.app_label, opts.model_name),
+        kwargs={'lookup': lookup})
+
+
+class AutocompleteAdminMixin(object):
+    '''
+    Serves the autocompletion of the related objects of the change form,
+    and uses it for the fields of autocomplete_lookups (field: lookup)
+    instead of rendering all the related objects as choices
+    '''
+    autocomplete_lookups = {}
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        return [
+            url(r'^autocomplete/(?P<lookup>%s)/$' % '|'.join(AUTOCOMPLETE_LOOKUPS),
+                self.admin_site.admin_view(self.autocomplete_view), name='%s_%s_autocomplete' % info),
+        ] + super(AutocompleteAdminMixin, self).get_urls()
+
+    def autocomplete_view(self, request, lookup):
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+
+        model, fields = AUTOCOMPLETE_LOOKUPS[lookup]
+        term = request.GET.get('term', '').strip()
+        try:
+            page = max(int(request.GET.get('page', 1)), 1)
+        except ValueError:
+            page = 1
+
+        qs = model._default_manager.order_by(fields[0])
+        if term:
+            match = Q()
+            for field in fields:
+                match |= Q(**{'%s__istartswith' % field: term})
+            qs = qs.filter(match)
+
+        start = (page - 1) * AUTOCOMPLETE_PAGE_SIZE
+        objs = list(qs[start:start + AUTOCOMPLETE_PAGE_SIZE + 1])
+
+        return JsonResponse({
+            'results': [{'id': obj.pk, 'text': '%s' % obj} for obj in objs[:AUTOCOMPLETE_PAGE_SIZE]],
+            'more': len(objs) > AUTOCOMPLETE_PAGE_SIZE,
+        })
+
+    def formfield_for_foreignkey(self, db_field, request=None, **kwargs):
+        if db_field.name in self.autocomplete_lookups:
+            kwargs['widget'] = AutocompleteSelect(
+                autocomplete_url(self.admin_site, self.model, self.autocomplete_lookups[db_field.name]))
+        return super(AutocompleteAdminMixin, self).formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def formfield_for_manytomany(self, db_field, request=None, **kwargs):
+        if db_field.name in self.autocomplete_lookups:
+            kwargs['widget'] = AutocompleteSelectMultiple(
+                autocomplete_url(self.admin_site, self.model, self.autocomplete_lookups[db_field.name]))
+        return super(AutocompleteAdminMixin, self).formfield_for_manytomany(db_field, request, **kwargs)
+
 
 class AuthorAdmin(TranslationAdmin):
     raw_id_fields = ('photo',)
@@ -50,6 +143,12 @@ class AuthorAdmin(TranslationAdmin):
 class AuthorDescriptionInline(admin.TabularInline):
     model = AuthorDescription
 
+    def formfield_for_foreignkey(self, db_field, request=None, **kwargs):
+        # Served by the admin of the post
+        if db_field.name == 'author':
+            kwargs['widget'] = AutocompleteSelect(autocomplete_url(self.admin_site, self.parent_model, 'author'))
+        return super(AuthorDescriptionInline, self).formfield_for_foreignkey(db_field, request, **kwargs)
+
 
 class CategoryAdmin(TranslationAdmin):
     list_display = ('name', 'slug', 'view_online')
@@ -59,19 +158,144 @@ class CategoryAdmin(TranslationAdmin):
 
     def view_online(self, obj):
         return format_html('<a href="{}">View online</a>',
-            reverse('blog_query_category', args=[obj.slug]))
+            url_builder.reverse('blog_query_category', obj.slug))
+
+
+class PostSearchMixin(object):
+    '''
+    Searches the full-text index instead of running icontains lookups on
+    all the search_fields, when the database supports it
+    '''
+    def get_search_results(self, request, queryset, search_term):
+        backend = get_backend()
+        if backend is None or not search_term.strip():
+            return super(PostSearchMixin, self).get_search_results(request, queryset, search_term)
+
+        return queryset.filter(pk__in=RawSQL(*backend.match_sql(search_term))), False
+
+
+class PrefixListFilter(admin.SimpleListFilter):
+    '''
+    Filters the posts on the prefix of the name of a related object typed
+    in, instead of listing all the related objects as choices. Subclasses
+    give the model linking the posts to the related objects (through) and
+    the lookup of the name from it (name_lookup).
+    '''
+    template = 'admin/blog/prefix_filter.html'
+    through = None
+    name_lookup = None
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def has_output(self):
+        return True
+
+    def posts(self, prefix):
+        '''
+        Returns the slugs of the posts matching the prefix, as a subquery
+        '''
+        return self.through.objects.filter(**{self.name_lookup + '__istartswith': prefix}).values('post')
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(pk__in=self.posts(self.value()))
+
+    def choices(self, changelist):
+        yield {
+            'parameter_name': self.parameter_name,
+            'value': self.value() or '',
+            # The other filters, search and ordering are kept
+            'params': sorted((k, v) for k, v in changelist.params.items() if k != self.parameter_name),
+            'clear_url': changelist.get_query_string(remove=[self.parameter_name]),
+        }
+
+
+class AuthorPrefixFilter(PrefixListFilter):
+    title = _('author')
+    parameter_name = 'author'
+    through = AuthorDescription
+    name_lookup = 'author__name'
+
+
+class TagPrefixFilter(PrefixListFilter):
+    title = _('tag')
+    parameter_name = 'tag'
+    through = Post.tags.through
+    name_lookup = 'tag__name'
+
+
+def estimate_count(queryset):
+    '''
+    Returns the PostgreSQL planner estimate of the number of rows of the
+    queryset
+    '''
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if not isinstance(plan, list):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    '''
+    Counting all the posts is the slowest part of the changelist on large
+    archives, large counts are estimated instead on PostgreSQL
+    '''
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if hasattr(queryset, 'query') and connections[queryset.db].vendor == 'postgresql':
+            estimate = estimate_count(queryset)
+            if estimate >= ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super(EstimatedCountPaginator, self).count
+
+
+class HighVolumeAdminMixin(object):
+    if ADMIN_HIGH_VOLUME:
+        paginator = EstimatedCountPaginator
+        # Don't count the unfiltered posts either
+        show_full_result_count = False
+
+
+class BodyCheckAdminMixin(object):
+    '''
+    Serves the check of the body template, posted by the change form while
+    the body is edited (see blog/js/check_body.js)
+    '''
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        return [
+            url(r'^check-body/$', self.admin_site.admin_view(self.check_body_view),
+                name='%s_%s_check_body' % info),
+        ] + super(BodyCheckAdminMixin, self).get_urls()
+
+    def check_body_view(self, request):
+        if request.method != 'POST':
+            return HttpResponseNotAllowed(['POST'])
+        if not (self.has_change_permission(request) or self.has_add_permission(request)):
+            raise PermissionDenied
+
+        error = check_template(request.POST.get('body', ''))
+        return JsonResponse({'valid': error is None, 'error': error})
 
 
 def view_online_post(post):
-    return format_html('<a href="{}">View online</a>', reverse('blog_detail', args=[post.slug]))
+    return format_html('<a href="{}">View online</a>', url_builder.path(post))
 
 
-class PostAdmin(dpadmin.DjangoplicityModelAdmin, CleanHTMLAdmin, RenameAdmin):
-    filter_horizontal = ('authors', 'tags')
+class PostAdmin(BodyCheckAdminMixin, AutocompleteAdminMixin, HighVolumeAdminMixin, PostSearchMixin, dpadmin.DjangoplicityModelAdmin, CleanHTMLAdmin, RenameAdmin):
+    autocomplete_lookups = {'banner': 'image', 'category': 'category', 'tags': 'tag'}
     inlines = (AuthorDescriptionInline, )
     list_display = ('slug', 'title', 'category', 'release_date', 'published', view_online_post)
-    list_filter = ('category', 'authors', 'tags')
-    raw_id_fields = ('banner', )
+    list_select_related = ('category', )
+    if ADMIN_HIGH_VOLUME:
+        list_filter = ('category', AuthorPrefixFilter, TagPrefixFilter)
+    else:
+        list_filter = ('category', 'authors', 'tags')
     readonly_fields = ('last_modified', 'created')
     richtext_fields = ('body', 'discover_box', 'numbers_box', 'profile', 'links')
     search_fields = ('slug', 'title', 'subtitle', 'lede', 'body', 'links', 'discover_box', 'numbers_box')
@@ -94,8 +318,10 @@ class PostAdmin(dpadmin.DjangoplicityModelAdmin, CleanHTMLAdmin, RenameAdmin):
 def view_online_translation_post(post):
     return format_html('<a href="{}?lang={}">View online</a>', post.get_absolute_url(), post.lang)
 
-class PostProxyAdmin(RenameAdmin, dpadmin.DjangoplicityModelAdmin, TranslationDuplicateAdmin, SyncTranslationAdmin, ArchiveAdmin):
+class PostProxyAdmin(BodyCheckAdminMixin, AutocompleteAdminMixin, HighVolumeAdminMixin, PostSearchMixin, RenameAdmin, dpadmin.DjangoplicityModelAdmin, TranslationDuplicateAdmin, SyncTranslationAdmin, ArchiveAdmin):
     list_display = ('slug', 'title', 'category', 'release_date', 'published', view_online_translation_post)
+    list_select_related = ('category', )
+    search_fields = PostAdmin.search_fields
     fieldsets = (
         (
             'Language',
@@ -115,6 +341,9 @@ class PostProxyAdmin(RenameAdmin, dpadmin.DjangoplicityModelAdmin, TranslationDu
         )
     )
     raw_id_fields = ('source',)
+    # Translations take their banner, category and tags from the source,
+    # they are only in the form if the fieldsets are overridden
+    autocomplete_lookups = PostAdmin.autocomplete_lookups
     richtext_fields = PostAdmin.richtext_fields
     readonly_fields = ['release_date', 'created', 'last_modified']
 
@@ -131,7 +360,7 @@ class TagAdmin(RenameAdmin, dpadmin.DjangoplicityModelAdmin):
 
     def view_online(self, obj):
         return format_html('<a href="{}">View online</a>',
-            reverse('blog_query_tag', args=[obj.slug]))
+            url_builder.reverse('blog_query_tag', obj.slug))
 
 
 def register_with_admin(admin_site):
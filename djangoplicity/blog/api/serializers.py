@@ -28,12 +28,15 @@
 # IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE
-from django.contrib.sites.models import Site
+from django.utils.translation import get_language
 from rest_framework import serializers
 
 from djangoplicity.archives.utils import get_instance_archives_urls
 
+from djangoplicity.blog.cache import PAYLOAD_CACHE_TIMEOUT, default_cache, get_version, \
+    payload_cache_key
 from djangoplicity.blog.models import AuthorDescription, Category, Post
+from djangoplicity.blog.utils import url_builder
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -56,6 +59,32 @@ class AuthorDescriptionSerializer(serializers.ModelSerializer):
         fields = ('name', 'description', 'photo', 'static_photo')
 
 
+class PostListSerializer(serializers.ListSerializer):
+    '''
+    Assembles the list from the cached representations of the posts,
+    fetched with a single multi-get
+    '''
+    def to_representation(self, data):
+        posts = list(data.all() if hasattr(data, 'all') else data)
+        version = get_version('api')
+        lang = get_language()
+        keys = [payload_cache_key(post, lang, version) for post in posts]
+        cached = default_cache.get_many(keys)
+
+        result = []
+        missing = {}
+        for key, post in zip(keys, posts):
+            item = cached.get(key)
+            if item is None:
+                item = missing[key] = self.child.serialize(post)
+            result.append(item)
+
+        if missing:
+            default_cache.set_many(missing, PAYLOAD_CACHE_TIMEOUT)
+
+        return result
+
+
 class PostSerializer(serializers.ModelSerializer):
     authors = AuthorDescriptionSerializer(source='authordescription_set', many=True)
     banner = serializers.SerializerMethodField(read_only=True)
@@ -67,13 +96,28 @@ class PostSerializer(serializers.ModelSerializer):
         return get_instance_archives_urls(obj.banner)
 
     def get_url(self, obj):
-        url = obj.get_absolute_url()
-        return 'https://{}{}'.format(Site.objects.get_current().domain, url)
+        return url_builder.absolute_url(obj)
 
     def get_id(self, obj):
         # Slug is the primary key of posts, we return the same Id for all translations in the API so that we can related
         return obj.source_id if obj.source_id else obj.pk
 
+    def serialize(self, instance):
+        return super(PostSerializer, self).to_representation(instance)
+
+    def to_representation(self, instance):
+        '''
+        The representation is cached until the post is modified or the
+        related authors and category change
+        '''
+        key = payload_cache_key(instance)
+        data = default_cache.get(key)
+        if data is None:
+            data = self.serialize(instance)
+            default_cache.set(key, data, PAYLOAD_CACHE_TIMEOUT)
+        return data
+
     class Meta:
+        list_serializer_class = PostListSerializer
         model = Post
         fields = ('id', 'slug', 'url', 'title', 'subtitle', 'banner', 'authors', 'category', 'lede', 'release_date')
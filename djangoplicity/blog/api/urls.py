@@ -33,11 +33,13 @@ from django.conf.urls import url
 
 from rest_framework.urlpatterns import format_suffix_patterns
 
-from djangoplicity.blog.api.views import PostList
+from djangoplicity.blog.api.views import ArchiveExport, PostList, PostSearch
 
 
 urlpatterns = [
     url(r'^posts/$', PostList.as_view()),
+    url(r'^search/$', PostSearch.as_view()),
+    url(r'^export/$', ArchiveExport.as_view()),
 ]
 
 urlpatterns = format_suffix_patterns(urlpatterns)
@@ -29,20 +29,135 @@
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE
 
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import ListAPIView
+from rest_framework.pagination import CursorPagination
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
 from djangoplicity.blog.api.serializers import PostSerializer
-from djangoplicity.blog.models import Post
+from djangoplicity.blog.exchange import export_records, gzip_stream, parse_timestamp, to_ndjson
+from djangoplicity.blog.models import Post, public_posts
 from djangoplicity.blog.options import PostOptions
+from djangoplicity.blog.queries import LIST_SELECT_RELATED
+from djangoplicity.blog.search import cached_search
+
+
+def parse_since(params, name):
+    if not params.get(name):
+        return None
+
+    since = parse_timestamp(params[name])
+    if since is None:
+        raise ValidationError({name: 'Invalid ISO 8601 timestamp'})
+    return since
+
+
+class PostCursorPagination(CursorPagination):
+    '''
+    Keyset pagination, the cost of a page doesn't depend on its depth. The
+    cursor can't hold a NULL position, so PostList leaves out the posts
+    without release date.
+    '''
+    ordering = ('-release_date', '-slug')
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
 
 
 class PostList(ListAPIView):
+    '''
+    Public posts, newest first. Supports the following filters:
+    ?category=<slug>, ?tag=<slug>, ?lang=<code> and
+    ?updated_since=<ISO 8601 timestamp>. Posts without release date are
+    left out, see PostCursorPagination.
+    '''
     serializer_class = PostSerializer
+    pagination_class = PostCursorPagination
 
     def get_queryset(self):
+        params = self.request.query_params
+
+        lang = params.get('lang')
+        if lang:
+            qs = public_posts().filter(lang=lang)
+        else:
+            qs = PostOptions.Queries.default.queryset(Post, PostOptions, None)[0]
+
+        if params.get('category'):
+            qs = qs.filter(category__slug=params['category'])
+
+        if params.get('tag'):
+            # Translations have the tags of their source
+            tagged = Post._base_manager.filter(tags__slug=params['tag']).values('pk')
+            qs = qs.filter(Q(pk__in=tagged) | Q(source__in=tagged))
+
+        since = parse_since(params, 'updated_since')
+        if since is not None:
+            qs = qs.filter(last_modified__gte=since)
+
         return (
-            PostOptions.Queries.default.queryset(Post, PostOptions, None)[0]
-            .select_related('banner', 'category')
+            qs.filter(release_date__isnull=False)
+            .select_related(*LIST_SELECT_RELATED)
             .prefetch_related('authordescription_set__author__photo')
-            [:10]
         )
+
+
+class PostSearch(APIView):
+    '''
+    Public posts matching ?q=<terms>, best match first, with a highlighted
+    excerpt of the body. Supports ?lang=<code> and ?page=<number>.
+    '''
+    per_page = 10
+
+    def get(self, request, *args, **kwargs):
+        params = request.query_params
+
+        try:
+            page = max(int(params.get('page', 1)), 1)
+        except ValueError:
+            raise ValidationError({'page': 'Invalid page number'})
+
+        hits, has_more = cached_search(params.get('q', ''), params.get('lang') or None, page, self.per_page)
+
+        posts = (
+            public_posts().select_related(*LIST_SELECT_RELATED)
+            .prefetch_related('authordescription_set__author__photo')
+            .defer('body', 'rendered_body', 'discover_box', 'numbers_box', 'links')
+            .in_bulk([slug for slug, snippet in hits])
+        )
+        hits = [(posts[slug], snippet) for slug, snippet in hits if slug in posts]
+
+        results = PostSerializer([post for post, snippet in hits], many=True, context={'request': request}).data
+        for data, (post, snippet) in zip(results, hits):
+            data['snippet'] = snippet
+
+        return Response({
+            'page': page,
+            'next': page + 1 if has_more else None,
+            'results': results,
+        })
+
+
+class ArchiveExport(APIView):
+    '''
+    Streams the whole archive as NDJSON, see djangoplicity.blog.exchange.
+    Supports ?since=<ISO 8601 timestamp>, ?after_slug=<slug> to resume an
+    export, and ?gzip=1.
+    '''
+    permission_classes = (IsAdminUser, )
+
+    def get(self, request, *args, **kwargs):
+        params = request.query_params
+        stream = to_ndjson(export_records(parse_since(params, 'since'), params.get('after_slug') or None))
+
+        if params.get('gzip'):
+            response = StreamingHttpResponse(gzip_stream(stream), content_type='application/gzip')
+            response['Content-Disposition'] = 'attachment; filename="blog.ndjson.gz"'
+        else:
+            response = StreamingHttpResponse(stream, content_type='application/x-ndjson')
+
+        return response
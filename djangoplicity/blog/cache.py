@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+#
+# eso-blog
+# Copyright (c) 2007-2017, European Southern Observatory (ESO)
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#
+#   * Neither the name of the European Southern Observatory nor the names
+#     of its contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY ESO ``AS IS'' AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL ESO BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER
+# IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE
+
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache as default_cache, caches
+from django.template import engines
+from django.utils.translation import get_language
+
+BODY_CACHE_SIZE = getattr(settings, 'BLOG_BODY_CACHE_SIZE', 256)
+# Alias of a cache from settings.CACHES shared by all processes, the
+# rendered bodies are stored there if set
+BODY_SHARED_CACHE = getattr(settings, 'BLOG_BODY_SHARED_CACHE', None)
+BODY_SHARED_CACHE_TIMEOUT = getattr(settings, 'BLOG_BODY_SHARED_CACHE_TIMEOUT', 60 * 60 * 24)
+PAYLOAD_CACHE_TIMEOUT = getattr(settings, 'BLOG_PAYLOAD_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+class LRUCache(object):
+    '''
+    Thread-safe and size bounded least recently used mapping, keeping
+    track of hits and misses
+    '''
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            # Re-insert the key so that it becomes the most recently used
+            self._data[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+        }
+
+
+# Compiled post bodies, keyed on (slug, lang, last_modified) so that
+# saving a post automatically stops using the previous entry
+body_templates = LRUCache(BODY_CACHE_SIZE)
+
+
+def body_cache_key(post):
+    return (post.pk, post.lang, post.last_modified)
+
+
+def get_body_template(post):
+    '''
+    Returns the compiled template for the body of the given post
+    '''
+    if post.last_modified is None:
+        return engines['django'].from_string(post.body)
+
+    key = body_cache_key(post)
+    tpl = body_templates.get(key)
+    if tpl is None:
+        tpl = engines['django'].from_string(post.body)
+        body_templates.set(key, tpl)
+
+    return tpl
+
+
+def render_body(post):
+    '''
+    Renders the body of the given post, which can contain template tags
+    '''
+    if not BODY_SHARED_CACHE or post.last_modified is None:
+        return get_body_template(post).render()
+
+    cache = caches[BODY_SHARED_CACHE]
+    key = 'blog_body_%s_%s_%s' % (
+        post.pk, post.lang, post.last_modified.strftime('%Y%m%d%H%M%S%f'))
+
+    html = cache.get(key)
+    if html is None:
+        html = get_body_template(post).render()
+        cache.set(key, html, BODY_SHARED_CACHE_TIMEOUT)
+
+    return html
+
+
+def get_version(name):
+    '''
+    Returns the version of a group of cached content, i.e. the timestamp
+    of its last change
+    '''
+    key = 'blog_version_%s' % name
+    version = default_cache.get(key)
+    if version is None:
+        version = time.time()
+        default_cache.add(key, version, None)
+
+    return version
+
+
+def bump_version(name):
+    '''
+    Marks all the content cached under the given version as stale
+    '''
+    default_cache.set('blog_version_%s' % name, time.time(), None)
+
+
+def payload_cache_key(post, lang=None, version=None):
+    '''
+    Cache key of the API representation of the given post, for the given
+    language (the active one by default) as translated fields of related
+    objects are included. Callers building several keys pass the 'api'
+    version read once.
+    '''
+    stamp = post.last_modified.strftime('%Y%m%d%H%M%S%f') if post.last_modified else ''
+    if version is None:
+        version = get_version('api')
+    return 'blog_api_post_%s_%s_%s_%s_%s' % (
+        post.pk, post.lang, lang or get_language(), stamp, version)
@@ -0,0 +1,364 @@
+# -*- coding: utf-8 -*-
+#
+# eso-blog
+# Copyright (c) 2007-2017, European Southern Observatory (ESO)
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#
+#   * Neither the name of the European Southern Observatory nor the names
+#     of its contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY ESO ``AS IS'' AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL ESO BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER
+# IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE
+
+'''
+Newline delimited JSON (NDJSON) export and import of the blog archive. Each
+line is a record with a "type" key: "category", "tag", "author" or "post"
+(which also covers translations, with "source_id" set). Posts are read in
+keyset chunks ordered by slug so that memory stays bounded and an
+interrupted export can be resumed from the last slug.
+'''
+from __future__ import unicode_literals
+
+import gzip
+import json
+import logging
+import multiprocessing
+import zlib
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from djangoplicity.blog.models import Author, AuthorDescription, Category, CategoryPostCount, Post, Tag, \
+    TagPostCount, invalidate_surfaces, run_task
+from djangoplicity.blog.tasks import render_posts, update_post_enclosures, update_related_posts, \
+    update_search_index
+from djangoplicity.blog.validators import validate_string_template
+
+logger = logging.getLogger(__name__)
+
+# Derived fields that are rebuilt on import
+POST_EXCLUDED_FIELDS = ('rendered_body', )
+
+
+def parse_timestamp(value):
+    '''
+    Parses an ISO 8601 timestamp, returns None if it isn't valid. Naive
+    timestamps are in UTC if USE_TZ is True, aware ones are converted to
+    the local time if it is False.
+    '''
+    timestamp = parse_datetime(value)
+    if timestamp is not None:
+        if settings.USE_TZ and timezone.is_naive(timestamp):
+            timestamp = timezone.make_aware(timestamp, timezone.utc)
+        elif not settings.USE_TZ and timezone.is_aware(timestamp):
+            timestamp = timezone.make_naive(timestamp)
+    return timestamp
+
+
+def _field_names(model, excluded=()):
+    return [f.attname for f in model._meta.concrete_fields if f.attname not in excluded]
+
+
+def export_records(since=None, after_slug=None, chunk_size=500):
+    '''
+    Yields the records of the archive. Posts can be restricted to the ones
+    modified since the given datetime and with a slug after the given one.
+    '''
+    if after_slug is None:
+        # Categories, tags and authors are small, they are only exported at
+        # the start of a run
+        for model, name in ((Category, 'category'), (Tag, 'tag'), (Author, 'author')):
+            for row in model.objects.order_by('pk').values(*_field_names(model)).iterator():
+                row['type'] = name
+                yield row
+
+    qs = Post._base_manager.order_by('pk')
+    if since is not None:
+        qs = qs.filter(last_modified__gte=since)
+
+    fields = _field_names(Post, POST_EXCLUDED_FIELDS)
+    last = after_slug
+    while True:
+        chunk = qs.filter(pk__gt=last) if last is not None else qs
+        rows = list(chunk.values(*fields)[:chunk_size].iterator())
+        if not rows:
+            break
+
+        slugs = [row['slug'] for row in rows]
+        tags = {}
+        for slug, tag in Post.tags.through.objects.filter(post__in=slugs).values_list('post', 'tag').iterator():
+            tags.setdefault(slug, []).append(tag)
+        authors = {}
+        descriptions = (
+            AuthorDescription.objects.filter(post__in=slugs).order_by('pk')
+            .values_list('post', 'author', 'description').iterator()
+        )
+        for slug, author, description in descriptions:
+            authors.setdefault(slug, []).append({'author': author, 'description': description})
+
+        for row in rows:
+            row['type'] = 'post'
+            row['tags'] = tags.get(row['slug'], [])
+            row['authors'] = authors.get(row['slug'], [])
+            yield row
+
+        last = slugs[-1]
+
+
+def to_ndjson(records):
+    '''
+    Yields the given records as lines of JSON, as bytes
+    '''
+    for record in records:
+        yield (json.dumps(record, cls=DjangoJSONEncoder) + '\n').encode('utf-8')
+
+
+def gzip_stream(chunks):
+    '''
+    Compresses the given stream of bytes in gzip format, chunk by chunk
+    '''
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def read_records(path):
+    '''
+    Yields the records of the given NDJSON file, gzipped if it ends in .gz
+    '''
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line.decode('utf-8'))
+
+
+def _check_body(item):
+    slug, body = item
+    try:
+        validate_string_template(body)
+    except ValidationError as e:
+        return slug, '; '.join(e.messages)
+    return slug, None
+
+
+def validate_bodies(records, processes=None):
+    '''
+    Validates the body templates of the post records in parallel, returns
+    a dict of slug: error for the invalid ones
+    '''
+    bodies = ((r['slug'], r['body']) for r in records if r.get('type') == 'post')
+
+    # The workers are forked, they must not share the database connections
+    connections.close_all()
+    pool = multiprocessing.Pool(processes)
+    try:
+        return dict(
+            (slug, error)
+            for slug, error in pool.imap_unordered(_check_body, bodies, chunksize=50)
+            if error
+        )
+    finally:
+        pool.close()
+        pool.join()
+
+
+class ArchiveImporter(object):
+    '''
+    Bulk creates the records of an export in batched transactions. Objects
+    which already exist are skipped, categories and tags are matched by
+    slug and authors by name, as their ids differ between archives. As bulk_create doesn't send signals the
+    derived fields and caches of the posts are updated after each batch, and
+    the counts, related posts and feed once, in finish().
+    '''
+    def __init__(self, batch_size=500, skip=()):
+        self.batch_size = batch_size
+        # Slugs of posts not to import, e.g. with invalid templates
+        self.skip = set(skip)
+        self.created = {'category': 0, 'tag': 0, 'author': 0, 'post': 0}
+        self.skipped = 0
+        self._batch = []
+        self._pending = []
+        self._known_posts = set()
+        # Exported id: local id of the categories, tags and authors
+        self._ids = {'category': {}, 'tag': {}, 'author': {}}
+
+    @staticmethod
+    def _fields(model, record):
+        names = set(f.attname for f in model._meta.concrete_fields)
+        return dict((k, v) for k, v in record.items() if k in names)
+
+    def add(self, record):
+        self._batch.append(record)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        batch, self._batch = self._batch, []
+        if batch:
+            with transaction.atomic():
+                slugs = self._import(batch)
+            self._dispatch(slugs)
+
+    def _create(self, model, name, key, records):
+        '''
+        Creates the objects whose key isn't in the archive yet, and maps the
+        exported ids to the local ones
+        '''
+        if not records:
+            return
+        keys = set(r[key] for r in records)
+        existing = set(model._base_manager.filter(**{key + '__in': keys}).values_list(key, flat=True))
+
+        new = {}
+        for record in records:
+            if record[key] not in existing and record[key] not in new:
+                fields = self._fields(model, record)
+                del fields['id']
+                new[record[key]] = model(**fields)
+        model._base_manager.bulk_create(new.values())
+        self.created[name] += len(new)
+        self.skipped += len(records) - len(new)
+
+        # bulk_create doesn't set the ids on all databases
+        ids = dict(model._base_manager.filter(**{key + '__in': keys}).order_by('-pk').values_list(key, 'pk'))
+        self._ids[name].update((r['id'], ids[r[key]]) for r in records)
+
+    def _remap(self, record):
+        '''
+        Returns the post record with the local ids of its category, tags and
+        authors. Ids not in the import, e.g. when resuming with --after-slug,
+        are kept as they are.
+        '''
+        categories, tags, authors = self._ids['category'], self._ids['tag'], self._ids['author']
+        return dict(
+            record,
+            category_id=categories.get(record['category_id'], record['category_id']),
+            tags=[tags.get(tag, tag) for tag in record.get('tags', [])],
+            authors=[
+                dict(a, author=authors.get(a['author'], a['author']))
+                for a in record.get('authors', [])
+            ],
+        )
+
+    def _import(self, batch):
+        for model, name, key in ((Category, 'category', 'slug'), (Tag, 'tag', 'slug'), (Author, 'author', 'name')):
+            self._create(model, name, key, [r for r in batch if r['type'] == name])
+
+        posts = [r for r in batch if r['type'] == 'post' and r['slug'] not in self.skip]
+        self.skipped += len([r for r in batch if r['type'] == 'post']) - len(posts)
+        if not posts:
+            return []
+
+        # Translations are created once their source exists
+        sources = [r['source_id'] for r in posts if r.get('source_id')]
+        self._known_posts.update(
+            Post._base_manager.filter(pk__in=sources).values_list('pk', flat=True))
+        self._known_posts.update(r['slug'] for r in posts if not r.get('source_id'))
+
+        ready = []
+        for record in posts:
+            if record.get('source_id') and record['source_id'] not in self._known_posts:
+                self._pending.append(record)
+            else:
+                ready.append(record)
+
+        return self._create_posts(ready)
+
+    def _create_posts(self, records):
+        '''
+        Returns the slugs of the posts created
+        '''
+        existing = set(
+            Post._base_manager.filter(pk__in=[r['slug'] for r in records]).values_list('pk', flat=True))
+        records = [self._remap(r) for r in records if r['slug'] not in existing]
+        self.skipped += len(existing)
+
+        posts = []
+        for record in records:
+            post = Post(**self._fields(Post, record))
+            # Same clean up as Post.save, the body is rendered in finish()
+            post.body = post.body.replace('\xa0', ' ')
+            post.rendered_body = ''
+            posts.append(post)
+        Post._base_manager.bulk_create(posts)
+
+        Post.tags.through.objects.bulk_create([
+            Post.tags.through(post_id=r['slug'], tag_id=tag)
+            for r in records for tag in r.get('tags', [])
+        ])
+        AuthorDescription.objects.bulk_create([
+            AuthorDescription(post_id=r['slug'], author_id=a['author'], description=a['description'])
+            for r in records for a in r.get('authors', [])
+        ])
+
+        self.created['post'] += len(posts)
+        return [post.pk for post in posts]
+
+    @staticmethod
+    def _dispatch(slugs):
+        '''
+        Sends the tasks updating the derived fields and caches of the given
+        newly created posts, one batch at a time to keep the messages small
+        '''
+        if not slugs:
+            return
+        run_task(render_posts, slugs)
+        run_task(update_post_enclosures, slugs)
+        run_task(update_search_index, slugs)
+        invalidate_surfaces(Post._base_manager.filter(pk__in=slugs), {'detail', 'list', 'api'})
+
+    def finish(self):
+        '''
+        Imports the remaining records, then updates the counts, the related
+        posts and the feed in one go
+        '''
+        self.flush()
+
+        pending, self._pending = self._pending, []
+        self._known_posts.update(
+            Post._base_manager.filter(pk__in=[r['source_id'] for r in pending]).values_list('pk', flat=True))
+        ready = [r for r in pending if r['source_id'] in self._known_posts]
+        if len(ready) < len(pending):
+            logger.warning('Skipping %d translations without source', len(pending) - len(ready))
+            self.skipped += len(pending) - len(ready)
+        for i in range(0, len(ready), self.batch_size):
+            with transaction.atomic():
+                slugs = self._create_posts(ready[i:i + self.batch_size])
+            self._dispatch(slugs)
+
+        if not self.created['post']:
+            return
+
+        TagPostCount.update()
+        CategoryPostCount.update()
+        # Imports are large, recomputing everything is cheaper than updating
+        run_task(update_related_posts)
+        invalidate_surfaces(Post._base_manager.none(), {'feed'})
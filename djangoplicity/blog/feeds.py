@@ -29,13 +29,43 @@
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE
 
+from io import BytesIO
+import gzip
+
 from djangoplicity.archives.feeds import DjangoplicityArchiveFeed
 from django.conf import settings
-from djangoplicity.blog.models import Post
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.http import HttpResponse
+from django.test.client import RequestFactory
+from django.utils import timezone
+from djangoplicity.blog.cache import default_cache, get_version
+from djangoplicity.blog.models import Post, PostEnclosure, run_task
 from djangoplicity.blog.options import PostOptions
+from djangoplicity.blog.utils import url_builder
+from djangoplicity.blog.views import accepts_gzip, conditional_post_list
 
 BLOG_TITLE = settings.BLOG_TITLE if hasattr( settings, 'BLOG_TITLE' ) else 'Blog'
 BLOG_DESCRIPTION = settings.BLOG_DESCRIPTION if hasattr( settings, 'BLOG_DESCRIPTION' ) else ''
+# How long the time at which the static feed becomes stale is cached
+FEED_EXPIRY_TIMEOUT = getattr(settings, 'BLOG_FEED_EXPIRY_TIMEOUT', 60 * 60)
+
+
+def static_feed_enabled():
+    '''
+    Whether the default feed is served from a file regenerated when posts
+    are published (BLOG_STATIC_FEED), read at call time so that it can be
+    overridden
+    '''
+    return getattr(settings, 'BLOG_STATIC_FEED', True)
+
+
+def feed_path():
+    '''
+    Storage path of the static feed (BLOG_FEED_PATH)
+    '''
+    return getattr(settings, 'BLOG_FEED_PATH', 'blog/feed.xml')
+
 
 class PostFeed(DjangoplicityArchiveFeed):
     title = BLOG_TITLE
@@ -51,14 +81,147 @@ class PostFeed(DjangoplicityArchiveFeed):
         default_query = PostOptions.Queries.default
         items_to_display = 10
 
+    def __call__(self, request, *args, **kwargs):
+        return conditional_post_list('feed', vary_encoding=True)(self.serve)(request, *args, **kwargs)
+
+    def serve(self, request, *args, **kwargs):
+        '''
+        The default feed is served from the pre-generated file when there is
+        one, other feeds and queries are rendered
+        '''
+        is_default = not any(args) and not any(kwargs.values()) and not request.GET
+        if static_feed_enabled() and is_default:
+            response = serve_static_feed(request)
+            if response is not None:
+                return response
+
+        return self.render(request, *args, **kwargs)
+
+    def render(self, request, *args, **kwargs):
+        return super(PostFeed, self).__call__(request, *args, **kwargs)
+
+    def items(self, obj):
+        '''
+        Attach the stored enclosures of the items, fetched in one query
+        '''
+        items = list(super(PostFeed, self).items(obj))
+        enclosures = PostEnclosure.objects.in_bulk([item.source_id or item.pk for item in items])
+        for item in items:
+            item.enclosure_data = enclosures.get(item.source_id or item.pk)
+        return items
+
+    def item_link(self, item):
+        return url_builder.path(item)
+
     def item_enclosure_url(self, item):
+        if item.enclosure_data:
+            return item.enclosure_data.url
         return item.banner.resource_screen.absolute_url
 
     def item_enclosure_length(self, item):
+        if item.enclosure_data:
+            return item.enclosure_data.length
+
+        # Not captured yet, see the update_blog_enclosures command
         size = item.banner.resource_screen.size
         if not item.banner.resource_screen.closed:
             item.banner.resource_screen.close()
         return size
 
     def item_enclosure_mime_type(self, item):
+        if item.enclosure_data:
+            return item.enclosure_data.mime_type
         return 'image/jpeg'
+
+
+def _next_release(written):
+    '''
+    Returns the release date of the first post released after the given
+    time, False if there is none yet
+    '''
+    if not settings.USE_TZ and timezone.is_aware(written):
+        written = timezone.make_naive(written)
+    release_date = (
+        Post._base_manager.filter(published=True, release_date__gt=written)
+        .order_by('release_date').values_list('release_date', flat=True).first()
+    )
+    return release_date or False
+
+
+def _expiry_key():
+    return 'blog_feed_expiry_%s' % get_version('feed')
+
+
+def static_feed_is_stale():
+    '''
+    Returns True if a post was released since the stored feed was written,
+    i.e. its embargo expired and process_released_posts didn't run yet. The
+    release date of the next post is cached with the feed version, so that
+    serving the feed doesn't touch the storage or the database.
+    '''
+    key = _expiry_key()
+    expiry = default_cache.get(key)
+    if expiry is None:
+        try:
+            written = default_storage.get_modified_time(feed_path())
+        except (NotImplementedError, IOError, OSError):
+            return False
+        expiry = _next_release(written)
+        default_cache.set(key, expiry, FEED_EXPIRY_TIMEOUT)
+
+    return expiry is not False and expiry <= timezone.now()
+
+
+def serve_static_feed(request):
+    '''
+    Returns the stored feed, gzipped if the client accepts it, or None if
+    it hasn't been generated yet or is stale, in which case it is
+    regenerated
+    '''
+    if static_feed_is_stale():
+        # Queued once until it's written, meanwhile the feed is rendered
+        if default_cache.add('blog_feed_regenerating', True, 60):
+            from djangoplicity.blog.tasks import generate_feed
+            run_task(generate_feed)
+        return None
+
+    path = feed_path()
+    gzipped = accepts_gzip(request)
+    if gzipped:
+        path += '.gz'
+
+    try:
+        with default_storage.open(path) as f:
+            content = f.read()
+    except (IOError, OSError):
+        return None
+
+    response = HttpResponse(content, content_type=PostFeed.feed_type.content_type)
+    if gzipped:
+        response['Content-Encoding'] = 'gzip'
+
+    return response
+
+
+def generate_static_feed():
+    '''
+    Renders the default feed and writes it, and a gzipped copy, to the
+    storage
+    '''
+    request = RequestFactory().get(PostFeed.link, secure=True)
+    content = PostFeed().render(request).content
+
+    buf = BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb', mtime=0) as f:
+        f.write(content)
+
+    base = feed_path()
+    for path, data in ((base, content), (base + '.gz', buf.getvalue())):
+        if default_storage.exists(path):
+            default_storage.delete(path)
+        default_storage.save(path, ContentFile(data))
+
+    default_cache.set(_expiry_key(), _next_release(timezone.now()), FEED_EXPIRY_TIMEOUT)
+    default_cache.delete('blog_feed_regenerating')
+
+    return len(content)
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+#
+# eso-blog
+# Copyright (c) 2007-2017, European Southern Observatory (ESO)
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#
+#   * Neither the name of the European Southern Observatory nor the names
+#     of its contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY ESO ``AS IS'' AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL ESO BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER
+# IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE
+
+from __future__ import unicode_literals
+
+import json
+import platform
+import time
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from djangoplicity.blog.cache import body_templates, render_body
+from djangoplicity.blog.feeds import PostFeed
+from djangoplicity.blog.models import Category, Post, Tag, public_posts
+
+
+class Command(BaseCommand):
+    help = 'Times the blog pages, feed, API and admin, and writes the results as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=10, help='Number of timed runs of each case')
+        parser.add_argument('--output', help='File to write the JSON results to, defaults to stdout')
+        parser.add_argument('--search', default='galaxy', help='Search terms of the search cases')
+        parser.add_argument('--admin', help='Username of the staff user of the admin cases, they are skipped if not given')
+
+    def time(self, func, repeat, cold):
+        '''
+        Returns the timings in ms and the number of queries of the function
+        '''
+        timings = []
+        queries = 0
+        for i in range(repeat):
+            if cold:
+                cache.clear()
+                body_templates.clear()
+            with CaptureQueriesContext(connection) as context:
+                start = time.time()
+                response = func()
+                timings.append((time.time() - start) * 1000)
+            queries = len(context)
+            status = getattr(response, 'status_code', 200)
+            if status != 200:
+                raise CommandError('Got a %d response' % status)
+
+        timings.sort()
+        return {
+            'min': timings[0],
+            'median': timings[len(timings) // 2],
+            'mean': sum(timings) / len(timings),
+            'max': timings[-1],
+            'queries': queries,
+        }
+
+    def cases(self, options):
+        hosts = [host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*']
+        client = Client(SERVER_NAME=hosts[0] if hosts else 'testserver')
+
+        def get(url, **params):
+            return lambda: client.get(url, params)
+
+        post = public_posts().filter(source__isnull=True).order_by('-release_date').first()
+        tag = Tag.objects.filter(tagpostcount__count__gt=0).order_by('-tagpostcount__count').first()
+        category = Category.objects.first()
+        if post is None or tag is None or category is None:
+            raise CommandError('No public posts to benchmark, see seed_blog')
+
+        request = RequestFactory().get('/')
+        # The API is included next to the sitemap
+        api = reverse('blog_sitemap')[:-len('sitemap.xml')] + 'api/'
+        cases = [
+            ('list', get(reverse('blog_defaultquery'))),
+            ('detail', get(reverse('blog_detail', args=[post.pk]))),
+            ('body_render', lambda: render_body(post)),
+            ('tag', get(reverse('blog_query_tag', args=[tag.slug]))),
+            ('category', get(reverse('blog_query_category', args=[category.slug]))),
+            ('search', get(reverse('blog_query_search'), q=options['search'])),
+            ('feed', lambda: PostFeed().render(request)),
+            ('api_posts', get(api + 'posts/')),
+            ('api_search', get(api + 'search/', q=options['search'])),
+        ]
+
+        if options['admin']:
+            user = get_user_model().objects.get(username=options['admin'])
+            admin_client = Client(SERVER_NAME=hosts[0] if hosts else 'testserver')
+            admin_client.force_login(user)
+            changelist = reverse('admin:blog_post_changelist')
+            cases += [
+                ('admin_changelist', lambda: admin_client.get(changelist)),
+                ('admin_search', lambda: admin_client.get(changelist, {'q': options['search']})),
+            ]
+
+        return cases
+
+    def handle(self, *args, **options):
+        results = {}
+        for name, func in self.cases(options):
+            results[name] = {
+                'cold': self.time(func, options['repeat'], cold=True),
+                'warm': self.time(func, options['repeat'], cold=False),
+            }
+            self.stderr.write('%s: %.1f ms cold, %.1f ms warm' % (
+                name, results[name]['cold']['median'], results[name]['warm']['median']))
+
+        output = json.dumps({
+            'timestamp': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'posts': Post._base_manager.count(),
+            'repeat': options['repeat'],
+            'results': results,
+        }, indent=2, sort_keys=True)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
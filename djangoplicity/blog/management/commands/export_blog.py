@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+#
+# eso-blog
+# Copyright (c) 2007-2017, European Southern Observatory (ESO)
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#
+#   * Neither the name of the European Southern Observatory nor the names
+#     of its contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY ESO ``AS IS'' AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL ESO BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER
+# IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE
+
+from __future__ import unicode_literals
+
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from djangoplicity.blog.exchange import export_records, gzip_stream, parse_timestamp, to_ndjson
+
+
+class Command(BaseCommand):
+    help = 'Exports the blog posts, translations, authors, tags and categories as NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', help='Output file, defaults to stdout')
+        parser.add_argument('--since', help='Only export posts modified since this ISO 8601 timestamp')
+        parser.add_argument('--after-slug', dest='after_slug', help='Resume the export after this post slug')
+        parser.add_argument('--chunk-size', dest='chunk_size', type=int, default=500)
+        parser.add_argument('--gzip', action='store_true', default=False, help='Compress the output')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = parse_timestamp(options['since'])
+            if since is None:
+                raise CommandError('Invalid --since timestamp: %s' % options['since'])
+
+        stream = to_ndjson(export_records(since, options['after_slug'], options['chunk_size']))
+        if options['gzip']:
+            stream = gzip_stream(stream)
+
+        if options['output']:
+            out = open(options['output'], 'wb')
+        else:
+            out = getattr(sys.stdout, 'buffer', sys.stdout)
+
+        try:
+            for chunk in stream:
+                out.write(chunk)
+        finally:
+            if options['output']:
+                out.close()
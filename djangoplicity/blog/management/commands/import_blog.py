@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+#
+# eso-blog
+# Copyright (c) 2007-2017, European Southern Observatory (ESO)
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#
+#   * Neither the name of the European Southern Observatory nor the names
+#     of its contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY ESO ``AS IS'' AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL ESO BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER
+# IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE
+
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand, CommandError
+
+from djangoplicity.blog.exchange import ArchiveImporter, read_records, validate_bodies
+
+
+class Command(BaseCommand):
+    help = 'Bulk imports blog posts, translations, authors, tags and categories from NDJSON (see export_blog)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='NDJSON file, optionally gzipped (.gz)')
+        parser.add_argument('--batch-size', dest='batch_size', type=int, default=500)
+        parser.add_argument('--processes', type=int, default=None,
+            help='Number of processes validating the templates, defaults to the number of CPUs')
+        parser.add_argument('--skip-invalid', dest='skip_invalid', action='store_true', default=False,
+            help='Import the valid posts even if some bodies are not valid templates')
+
+    def handle(self, *args, **options):
+        path = options['path']
+
+        errors = validate_bodies(read_records(path), options['processes'])
+        for slug, error in sorted(errors.items()):
+            self.stderr.write('%s: %s' % (slug, error))
+        if errors and not options['skip_invalid']:
+            raise CommandError('%d posts have invalid templates, nothing imported' % len(errors))
+
+        importer = ArchiveImporter(options['batch_size'], skip=errors)
+        for record in read_records(path):
+            importer.add(record)
+        importer.finish()
+
+        self.stdout.write('Created %s, skipped %d' % (
+            ', '.join('%d %s' % (count, name) for name, count in sorted(importer.created.items())),
+            importer.skipped
+        ))
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+#
+# eso-blog
+# Copyright (c) 2007-2017, European Southern Observatory (ESO)
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#
+#   * Neither the name of the European Southern Observatory nor the names
+#     of its contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY ESO ``AS IS'' AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL ESO BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER
+# IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE
+
+from __future__ import unicode_literals
+
+from datetime import timedelta
+import random
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from djangoplicity.media.models import Image
+
+from djangoplicity.blog.exchange import ArchiveImporter
+from djangoplicity.blog.models import Author, Category, Tag
+
+WORDS = (
+    'galaxy star planet nebula telescope observatory cluster light spectrum '
+    'universe dark matter energy black hole supernova comet asteroid orbit '
+    'moon sun mirror dome night sky astronomer data image survey infrared '
+    'radio wave dust gas formation evolution distance redshift exoplanet '
+    'atmosphere instrument laser adaptive optics array antenna signal'
+).split()
+
+
+class Command(BaseCommand):
+    help = 'Generates a large archive of fake blog posts, e.g. for benchmarks (see benchmark_blog)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=1000)
+        parser.add_argument('--languages', default='',
+            help='Comma separated languages each post is translated to, defaults to all the other site languages')
+        parser.add_argument('--tags', type=int, default=200)
+        parser.add_argument('--authors', type=int, default=100)
+        parser.add_argument('--categories', type=int, default=10)
+        parser.add_argument('--images', type=int, default=50,
+            help='Number of archive images (without files) used as banners and photos')
+        parser.add_argument('--paragraphs', type=int, default=10, help='Number of paragraphs of each body')
+        parser.add_argument('--batch-size', dest='batch_size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the random generator')
+
+    def text(self, words):
+        return ' '.join(self.random.choice(WORDS) for i in range(words))
+
+    def body(self, paragraphs):
+        return '\n'.join('<p>%s.</p>' % self.text(self.random.randint(40, 120)) for i in range(paragraphs))
+
+    def handle(self, *args, **options):
+        if options['posts'] and (options['images'] < 1 or options['categories'] < 1):
+            raise CommandError('Posts need at least one image and one category')
+
+        self.random = random.Random(options['seed'])
+        if options['languages']:
+            languages = options['languages'].split(',')
+        else:
+            languages = [code for code, name in settings.LANGUAGES if code != settings.LANGUAGE_CODE]
+
+        # Images are stubs, their resources don't exist
+        images = ['blog-seed-%d-%d' % (options['seed'], i) for i in range(options['images'])]
+        existing = set(Image.objects.filter(id__in=images).values_list('pk', flat=True))
+        Image.objects.bulk_create(
+            [Image(id=pk, title=self.text(4)) for pk in images if pk not in existing],
+            batch_size=options['batch_size']
+        )
+
+        # Categories, tags and authors are few, they are created one by one
+        # so that the database assigns their ids
+        ids = {}
+        for model, name, count in ((Category, 'category', options['categories']), (Tag, 'tag', options['tags'])):
+            ids[name] = [
+                model.objects.get_or_create(slug='seed-%d-%s-%d' % (options['seed'], name, i), defaults={
+                    'name': '%s %d' % (self.text(1).title(), i),
+                })[0].pk
+                for i in range(count)
+            ]
+        ids['author'] = [
+            Author.objects.create(
+                name=self.text(2).title(), photo_id=self.random.choice(images) if images else None
+            ).pk
+            for i in range(options['authors'])
+        ]
+
+        importer = ArchiveImporter(options['batch_size'])
+
+        now = timezone.now()
+        for i in range(options['posts']):
+            slug = 'seed-%d-%d' % (options['seed'], i)
+            release_date = now - timedelta(hours=i)
+            post = {
+                'type': 'post',
+                'slug': slug,
+                'lang': settings.LANGUAGE_CODE,
+                'title': self.text(6).capitalize(),
+                'subtitle': self.text(8).capitalize(),
+                'lede': self.text(40).capitalize(),
+                'body': self.body(options['paragraphs']),
+                'banner_id': self.random.choice(images) if images else None,
+                'category_id': self.random.choice(ids['category']) if ids['category'] else None,
+                'published': True,
+                'release_date': release_date,
+                'tags': self.random.sample(ids['tag'], min(len(ids['tag']), self.random.randint(1, 6))),
+                'authors': [
+                    {'author': author, 'description': ''}
+                    for author in self.random.sample(ids['author'], min(len(ids['author']), self.random.randint(1, 3)))
+                ],
+            }
+            importer.add(post)
+
+            for lang in languages:
+                # Translations have a copy of the banner and category
+                importer.add(dict(
+                    post, slug='%s-%s' % (slug, lang), lang=lang, source_id=slug, tags=[], authors=[],
+                    title=self.text(6).capitalize(), body=self.body(options['paragraphs']),
+                ))
+
+        importer.finish()
+
+        self.stdout.write('Created %d images, %d posts, using %d categories, %d tags and %d authors' % (
+            len(images) - len(existing), importer.created['post'],
+            len(ids['category']), len(ids['tag']), len(ids['author'])))
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0010_post_rendered_body'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryPostCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lang', models.CharField(max_length=7)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='blog.Category')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TagPostCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lang', models.CharField(max_length=7)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='blog.Tag')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='categorypostcount',
+            unique_together=set([('category', 'lang')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='tagpostcount',
+            unique_together=set([('tag', 'lang')]),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0012_post_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostEnclosure',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='enclosure', serialize=False, to='blog.Post')),
+                ('url', models.CharField(max_length=255)),
+                ('length', models.BigIntegerField(default=0)),
+                ('mime_type', models.CharField(default='image/jpeg', max_length=50)),
+            ],
+        ),
+    ]
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# The SQL is frozen here rather than imported from djangoplicity.blog.search,
+# which describes the current state of the table, not the one at this
+# migration
+CREATE_SQL = {
+    'postgresql': (
+        'CREATE TABLE blog_post_search ('
+        ' slug varchar(50) PRIMARY KEY,'
+        ' lang varchar(7) NOT NULL,'
+        ' document tsvector NOT NULL)',
+        'CREATE INDEX blog_post_search_document ON blog_post_search USING GIN (document)',
+        'CREATE INDEX blog_post_search_lang ON blog_post_search (lang)',
+    ),
+    'sqlite': (
+        "CREATE VIRTUAL TABLE blog_post_search USING fts5("
+        "slug UNINDEXED, lang UNINDEXED, title, lede, body, tokenize = 'porter unicode61')",
+    ),
+}
+
+
+def create_search_table(apps, schema_editor):
+    for sql in CREATE_SQL.get(schema_editor.connection.vendor, ()):
+        schema_editor.execute(sql)
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor in CREATE_SQL:
+        schema_editor.execute('DROP TABLE blog_post_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0013_postenclosure'),
+    ]
+
+    operations = [
+        # Run rebuild_blog_search_index to index the existing posts
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
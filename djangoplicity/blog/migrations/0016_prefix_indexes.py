@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# Columns searched by prefix by the admin autocompletion, with istartswith.
+# The media_image indexes belong to djangoplicity.media, which is a separate
+# package without them; they are only needed for the banner and photo
+# autocompletion of the blog admin, so they are created here, prefixed with
+# blog_, and the migration depends on the media migration creating the table.
+PREFIX_INDEXES = (
+    ('blog_author_name_prefix', 'blog_author', 'name'),
+    ('blog_tag_name_prefix', 'blog_tag', 'name'),
+    ('blog_media_image_id_prefix', 'media_image', 'id'),
+    ('blog_media_image_title_prefix', 'media_image', 'title'),
+)
+
+
+def create_prefix_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for name, table, column in PREFIX_INDEXES:
+        if vendor == 'postgresql':
+            # Matches the UPPER("column"::text) LIKE UPPER(...) of istartswith
+            schema_editor.execute('CREATE INDEX %s ON %s (UPPER(%s::text) text_pattern_ops)' % (name, table, column))
+        elif vendor == 'sqlite':
+            schema_editor.execute('CREATE INDEX %s ON %s (%s COLLATE NOCASE)' % (name, table, column))
+
+
+def drop_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        for name, table, column in PREFIX_INDEXES:
+            schema_editor.execute('DROP INDEX %s' % name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0015_relatedpost'),
+        ('media', '0021_auto_20170207_1749'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_prefix_indexes, drop_prefix_indexes),
+    ]
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0017_taskrun'),
+    ]
+
+    operations = [
+        # Run rebuild_blog_related_posts to fill them for the existing posts
+        migrations.CreateModel(
+            name='RelatedFeature',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('feature', models.CharField(db_index=True, max_length=100)),
+                ('weight', models.FloatField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='blog.Post')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RelatedIdf',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lang', models.CharField(max_length=7)),
+                ('feature', models.CharField(max_length=100)),
+                ('idf', models.FloatField()),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='relatedfeature',
+            unique_together=set([('post', 'feature')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='relatedidf',
+            unique_together=set([('lang', 'feature')]),
+        ),
+    ]
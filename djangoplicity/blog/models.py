@@ -30,20 +30,187 @@
 # POSSIBILITY OF SUCH DAMAGE
 
 from __future__ import unicode_literals
-import copy
 
-from django.core.exceptions import ObjectDoesNotExist, ValidationError
-from django.db import models
+from collections import Counter
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ObjectDoesNotExist, ValidationError
+from django.db import models, transaction
+from django.db.models import Count, Q
 from django.db.models import signals
-from django.template import Engine, Template
+from django.template import engines
 from django.template.base import TemplateSyntaxError
 
-from djangoplicity.archives.base import ArchiveModel, cache_handler
+from djangoplicity.archives.base import ArchiveModel
 from djangoplicity.media.models import Image
 from djangoplicity.translation.fields import TranslationManyToManyField, TranslationForeignKey
-from djangoplicity.translation.models import TranslationModel, translation_reverse
-from django.utils.translation import ugettext_lazy as _
-from djangoplicity.blog.validators import validate_string_template
+from djangoplicity.translation.models import TranslationModel
+from django.utils import timezone
+from django.utils.translation import get_language, ugettext_lazy as _
+from djangoplicity.blog.cache import bump_version, default_cache, get_version
+from djangoplicity.blog.search import index_posts, unindex_posts
+from djangoplicity.blog.utils import url_builder
+from djangoplicity.blog.validators import check_template, validate_string_template
+
+def async_tasks():
+    '''
+    Whether the cache invalidation and other post processing run in Celery
+    tasks instead of in the request (BLOG_ASYNC_TASKS), read at call time
+    so that it can be overridden e.g. in tests
+    '''
+    return getattr(settings, 'BLOG_ASYNC_TASKS', True)
+
+
+def run_task(task, *args):
+    '''
+    Sends the given task once the current transaction is committed, or runs
+    it right away if BLOG_ASYNC_TASKS is False
+    '''
+    if async_tasks():
+        transaction.on_commit(lambda: task.delay(*args))
+    else:
+        task(*args)
+
+
+def run_merged_task(task, slugs):
+    '''
+    Sends the given task taking a list of slugs once the current transaction
+    is committed, the slugs given for the same task during the transaction
+    are merged so that e.g. saving a post and its tags sends a single task
+    '''
+    def send():
+        slugs = sorted(send.slugs)
+        if async_tasks():
+            task.delay(slugs)
+        else:
+            task(slugs)
+
+    connection = transaction.get_connection()
+    if connection.in_atomic_block:
+        for sids, func in connection.run_on_commit:
+            if getattr(func, 'task', None) is task:
+                func.slugs.update(slugs)
+                return
+
+    send.task = task
+    send.slugs = set(slugs)
+    transaction.on_commit(send)
+
+
+def public_posts():
+    '''
+    Returns the published and non embargoed posts, including translations
+    '''
+    return Post._base_manager.filter(
+        Q(release_date__lte=timezone.now()) | Q(release_date__isnull=True),
+        published=True
+    )
+
+
+def invalidate_posts(queryset):
+    '''
+    Clears the cache of the posts in the given queryset and of their
+    translations. The slugs are collected in one query and sent to a single
+    task once the current transaction is committed.
+    '''
+    from djangoplicity.blog.tasks import invalidate_posts_cache
+
+    pks = queryset.values('pk')
+    slugs = list(
+        Post._base_manager.filter(Q(pk__in=pks) | Q(source__in=pks))
+        .values_list('pk', flat=True).distinct()
+    )
+    if slugs:
+        run_task(invalidate_posts_cache, slugs)
+
+
+def invalidate_surfaces(posts, surfaces):
+    '''
+    Clears the caches of the given surfaces ('detail', 'list', 'feed',
+    'api') for the posts in the given queryset
+    '''
+    if not surfaces:
+        return
+
+    # The archive cache holds the rendered detail and list pages
+    if 'detail' in surfaces or 'list' in surfaces:
+        invalidate_posts(posts)
+
+    if 'feed' in surfaces:
+        from djangoplicity.blog.tasks import generate_feed
+        run_task(generate_feed)
+
+    for surface in surfaces:
+        bump_version(surface)
+
+
+class ChangeTrackingMixin(object):
+    '''
+    Keeps track of the field values loaded from the database, so that
+    saving only invalidates the cached surfaces where the changed fields
+    are displayed.
+    '''
+    # Field name -> surfaces ('detail', 'list', 'feed', 'api') showing it
+    cache_surfaces = {}
+
+    def __init__(self, *args, **kwargs):
+        super(ChangeTrackingMixin, self).__init__(*args, **kwargs)
+        self.reset_tracked_fields()
+
+    @classmethod
+    def _tracked_attnames(cls):
+        '''
+        Returns a list of (attname, field name), including the per
+        language columns added by modeltranslation
+        '''
+        if '_tracked_attnames_cache' not in cls.__dict__:
+            attnames = []
+            languages = [code for code, name in settings.LANGUAGES]
+            for name in cls.cache_surfaces:
+                field = cls._meta.get_field(name)
+                attnames.append((field.attname, name))
+                for lang in languages:
+                    column = '%s_%s' % (name, lang.replace('-', '_'))
+                    try:
+                        cls._meta.get_field(column)
+                    except FieldDoesNotExist:
+                        continue
+                    attnames.append((column, name))
+            cls._tracked_attnames_cache = attnames
+        return cls._tracked_attnames_cache
+
+    def reset_tracked_fields(self):
+        # Deferred fields are not in __dict__ and are not tracked
+        self._tracked_values = dict(
+            (attname, self.__dict__[attname])
+            for attname, name in self._tracked_attnames()
+            if attname in self.__dict__
+        )
+
+    def changed_fields(self):
+        changed = set()
+        for attname, name in self._tracked_attnames():
+            if attname in self._tracked_values and attname in self.__dict__:
+                if self._tracked_values[attname] != self.__dict__[attname]:
+                    changed.add(name)
+        return changed
+
+    def changed_surfaces(self, created=False):
+        '''
+        Returns the surfaces affected by the unsaved changes, all of them
+        for new objects
+        '''
+        fields = self.cache_surfaces.keys() if created else self.changed_fields()
+        surfaces = set()
+        for name in fields:
+            surfaces.update(self.cache_surfaces[name])
+        return surfaces
+
+    def save(self, *args, **kwargs):
+        super(ChangeTrackingMixin, self).save(*args, **kwargs)
+        # The post_save handlers have seen the changes by now
+        self.reset_tracked_fields()
+
 
 class BlogTranslationProxyMixin(object):
     def validate_unique(self, exclude=None):
@@ -61,7 +228,7 @@ class BlogTranslationProxyMixin(object):
         super(BlogTranslationProxyMixin, self).validate_unique(exclude=exclude)
 
 
-class Author(models.Model):
+class Author(ChangeTrackingMixin, models.Model):
     name = models.CharField(max_length=100)
     biography = models.TextField(blank=True)
     photo = models.ForeignKey(
@@ -73,13 +240,22 @@ class Author(models.Model):
         help_text='Direct link to a JPG image, recommended size: 350px wide'
     )
 
+    cache_surfaces = {
+        'name': ('detail', 'list', 'api'),
+        'biography': ('detail', ),
+        'photo': ('detail', 'api'),
+        'static_photo': ('detail', 'api'),
+    }
+
     def __unicode__(self):
         return self.name
 
     @staticmethod
-    def post_save_handler(sender, instance, **kwargs):
-        for post in instance.post_set.all():
-            cache_handler(Post, instance=post)
+    def post_save_handler(sender, instance, created=False, **kwargs):
+        invalidate_surfaces(
+            Post._base_manager.filter(authors=instance),
+            instance.changed_surfaces(created)
+        )
 
 
 class AuthorDescription(models.Model):
@@ -98,7 +274,7 @@ class AuthorDescription(models.Model):
         return self.description + ' ' + self.author.name
 
 
-class Category(models.Model):
+class Category(ChangeTrackingMixin, models.Model):
     name = models.CharField(max_length=100)
     slug = models.SlugField(
         blank=False, unique=True,
@@ -108,6 +284,12 @@ class Category(models.Model):
         blank=True, help_text='Optional footer added to the bottom of posts'
     )
 
+    cache_surfaces = {
+        'name': ('detail', 'list', 'api'),
+        'slug': ('detail', 'list'),
+        'footer': ('detail', ),
+    }
+
     class Meta:
         verbose_name_plural = 'categories'
 
@@ -115,12 +297,14 @@ class Category(models.Model):
         return self.name
 
     @staticmethod
-    def post_save_handler(sender, instance, **kwargs):
-        for post in instance.post_set.all():
-            cache_handler(Post, instance=post)
+    def post_save_handler(sender, instance, created=False, **kwargs):
+        invalidate_surfaces(
+            Post._base_manager.filter(category=instance),
+            instance.changed_surfaces(created)
+        )
 
 
-class Post(ArchiveModel, TranslationModel):
+class Post(ChangeTrackingMixin, ArchiveModel, TranslationModel):
     slug = models.SlugField(primary_key=True, help_text='Used for the URL, this cannot be updated later')
     title = models.CharField(max_length=255)
     subtitle = models.CharField(
@@ -133,16 +317,43 @@ class Post(ArchiveModel, TranslationModel):
     tags = TranslationManyToManyField('Tag', blank=True)
     lede = models.TextField()
     body = models.TextField(validators=[validate_string_template])
+    rendered_body = models.TextField(
+        blank=True, editable=False,
+        help_text='Body with the template tags expanded, updated on save'
+    )
     discover_box = models.TextField(blank=True)
     numbers_box = models.TextField(blank=True)
     profile = models.TextField(blank=True)
     links = models.TextField(blank=True)
 
+    # Changes to a post itself update last_modified, which all the cached
+    # surfaces are keyed on, the mapping is used to skip unrelated work
+    cache_surfaces = {
+        'title': ('detail', 'list', 'feed', 'api'),
+        'subtitle': ('detail', 'list', 'feed', 'api'),
+        'banner': ('detail', 'list', 'feed', 'api'),
+        'category': ('detail', 'list', 'feed', 'api'),
+        'lede': ('detail', 'feed', 'api'),
+        'release_date': ('detail', 'list', 'feed', 'api'),
+        'published': ('detail', 'list', 'feed', 'api'),
+        'body': ('detail', 'feed'),
+        'discover_box': ('detail', ),
+        'numbers_box': ('detail', ),
+        'profile': ('detail', ),
+        'links': ('detail', ),
+    }
+
     class Meta:
         ordering = ('-release_date', )
+        indexes = [
+            # Keyset pagination and filters of the API
+            models.Index(fields=['release_date', 'slug'], name='blog_post_release_slug_idx'),
+            models.Index(fields=['lang', 'release_date'], name='blog_post_lang_release_idx'),
+            models.Index(fields=['last_modified'], name='blog_post_last_modified_idx'),
+        ]
 
     class Translation:
-        fields = ['title', 'subtitle', 'lede', 'body', 'discover_box', 'numbers_box', 'profile', 'links']
+        fields = ['title', 'subtitle', 'lede', 'body', 'rendered_body', 'discover_box', 'numbers_box', 'profile', 'links']
         excludes = ['published', 'last_modified', 'created']
         non_default_languages_in_fallback = False  # Don't show non-en post. if no en translation is available
 
@@ -160,6 +371,10 @@ class Post(ArchiveModel, TranslationModel):
                 ('blog_post', 'source_id'),
                 ('blog_authordescription', 'post_slug'),
                 ('blog_post_tags', 'post_slug'),
+                ('blog_postenclosure', 'post_id'),
+                ('blog_relatedpost', 'post_id'),
+                ('blog_relatedpost', 'related_id'),
+                ('blog_relatedfeature', 'post_id'),
             )
             clean_html_fields = ['body', 'discover_box', 'numbers_box', 'profile', 'links']
 
@@ -169,10 +384,17 @@ class Post(ArchiveModel, TranslationModel):
     def save(self, *args, **kwargs):
         '''
         Remove unicode non-breaking white-spaces as they mess up the
-        template tags
+        template tags, and store the rendered body
         '''
         if '\xa0' in self.body:
             self.body = self.body.replace('\xa0', ' ')
+
+        try:
+            self.rendered_body = self.render_body()
+        except TemplateSyntaxError:
+            # The body will be rendered (and fail) on request instead
+            self.rendered_body = ''
+
         super(Post, self).save(*args, **kwargs)
 
     @property
@@ -182,25 +404,28 @@ class Post(ArchiveModel, TranslationModel):
         '''
         return self.banner
 
-    def test_render_errors(self):
+    def render_body(self):
         '''
-        Tries to render the body, return None if everything is fine
-        or the error so it can be displayed in the admin
+        Expands the template tags of the body
         '''
-        # In production the template Engine has debug set to False, but as
-        # we need it to identify any possible rendering errors we copy it
-        # and set the copies debug to True
-        engine = copy.copy(Engine.get_default())
-        engine.debug = True
+        return engines['django'].from_string(self.body).render()
 
-        try:
-            Template(self.body, engine=engine)
-        except TemplateSyntaxError as e:
-            return e.template_debug
+    def test_render_errors(self):
+        '''
+        Checks the body, return None if everything is fine or the error
+        (message, line, token) so it can be displayed in the admin
+        '''
+        return check_template(self.body)
 
     def get_absolute_url(self):
-        post = self.get_source()
-        return translation_reverse('blog_detail', args=[post.slug], lang=self.lang)
+        return url_builder.path(self)
+
+    def counted_tag_ids(self):
+        '''
+        Returns the ids of the tags the post is counted in, translations
+        are counted in the tags of their source
+        '''
+        return list(Post.tags.through.objects.filter(post=self.source_id or self.pk).values_list('tag', flat=True))
 
     def og_title(self):
         '''
@@ -211,6 +436,92 @@ class Post(ArchiveModel, TranslationModel):
             title += ' ' + self.subtitle
         return title
 
+    # Fields in the full-text index, see djangoplicity.blog.search
+    search_fields = {'title', 'subtitle', 'lede', 'body', 'discover_box', 'numbers_box', 'links'}
+
+    @staticmethod
+    def post_save_handler(sender, instance, created=False, raw=False, **kwargs):
+        '''
+        Updates the search index, the feed enclosure of the post, its
+        related posts and the post counts of its tags and category
+        '''
+        if raw:
+            return
+
+        changed = instance.changed_fields()
+
+        if created or changed & Post.search_fields:
+            index_posts([instance])
+
+        # The cached search results only hold public posts
+        if created or changed & (Post.search_fields | {'published', 'release_date'}):
+            bump_version('search')
+
+        # Translations use the banner of their source
+        if not instance.source_id and (created or 'banner' in changed):
+            from djangoplicity.blog.tasks import update_post_enclosures
+            run_task(update_post_enclosures, [instance.pk])
+
+        if created or changed & (Post.search_fields | {'published', 'release_date', 'category'}):
+            from djangoplicity.blog.tasks import update_related_posts
+            run_merged_task(update_related_posts, [instance.pk])
+
+        if created or changed & {'published', 'release_date', 'category'}:
+            CategoryPostCount.update([instance.category_id, instance._tracked_values.get('category_id')])
+            TagPostCount.update(instance.counted_tag_ids())
+
+        # Drafts are not in the feed, unless they just got unpublished
+        if instance.published or 'published' in changed:
+            if 'feed' in instance.changed_surfaces(created):
+                from djangoplicity.blog.tasks import generate_feed
+                run_task(generate_feed)
+
+    @staticmethod
+    def banner_save_handler(sender, instance, raw=False, **kwargs):
+        '''
+        The image resources might have been (re)generated
+        '''
+        if raw:
+            return
+
+        from djangoplicity.blog.tasks import update_post_enclosures
+        slugs = list(Post.objects.filter(banner=instance).values_list('pk', flat=True))
+        if slugs:
+            run_task(update_post_enclosures, slugs)
+
+    @staticmethod
+    def pre_delete_handler(sender, instance, **kwargs):
+        # The m2m rows are gone by the time post_delete is sent
+        instance._counted_tag_ids = instance.counted_tag_ids()
+
+    @staticmethod
+    def post_delete_handler(sender, instance, **kwargs):
+        unindex_posts([instance.pk])
+        bump_version('search')
+        CategoryPostCount.update([instance.category_id])
+        TagPostCount.update(getattr(instance, '_counted_tag_ids', []))
+
+        if instance.published:
+            from djangoplicity.blog.tasks import generate_feed
+            run_task(generate_feed)
+
+    @staticmethod
+    def tags_changed_handler(sender, instance, action, reverse, pk_set, **kwargs):
+        if reverse:
+            # Posts added to or removed from a tag
+            if action in ('post_add', 'post_remove', 'post_clear'):
+                TagPostCount.update([instance.pk])
+        elif action == 'pre_clear':
+            instance._counted_tag_ids = list(instance.tags.values_list('pk', flat=True))
+        elif action == 'post_clear':
+            TagPostCount.update(getattr(instance, '_counted_tag_ids', []))
+        elif action in ('post_add', 'post_remove'):
+            TagPostCount.update(pk_set)
+
+        if not reverse and action in ('post_add', 'post_remove', 'post_clear'):
+            from djangoplicity.blog.tasks import update_related_posts
+            run_merged_task(update_related_posts, [instance.pk])
+
 
 # ========================================================================
 # Translation proxy model,
@@ -231,20 +542,234 @@ class PostProxy(BlogTranslationProxyMixin, Post):
         verbose_name = _('Post translation')
 
     def get_absolute_url(self):
-        post = self.get_source()
-        return translation_reverse('blog_detail', args=[post.slug], lang=self.lang)
+        return url_builder.path(self)
+
+
+class PostEnclosure(models.Model):
+    '''
+    URL, size and MIME type of the banner resource used as the feed
+    enclosure of a post, captured when the banner is assigned or its
+    resources are generated so that the feed does no storage I/O
+    '''
+    post = models.OneToOneField(Post, primary_key=True, on_delete=models.CASCADE, related_name='enclosure')
+    url = models.CharField(max_length=255)
+    length = models.BigIntegerField(default=0)
+    mime_type = models.CharField(max_length=50, default='image/jpeg')
+
+    def __unicode__(self):
+        return self.url
+
+
+class RelatedPost(models.Model):
+    '''
+    One of the most similar posts of a post in the same language, computed
+    by djangoplicity.blog.related
+    '''
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='related_set')
+    related = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = ('post', 'related')
+
+    def __unicode__(self):
+        return '%s: %s' % (self.post_id, self.related_id)
 
 
-class Tag(models.Model):
+class RelatedFeature(models.Model):
+    '''
+    Weight of a word or tag in the vector of a public post, the inverted
+    index used to update the related posts of the posts sharing it
+    '''
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+')
+    feature = models.CharField(max_length=100, db_index=True)
+    weight = models.FloatField()
+
+    class Meta:
+        unique_together = ('post', 'feature')
+
+    def __unicode__(self):
+        return '%s: %s' % (self.post_id, self.feature)
+
+
+class RelatedIdf(models.Model):
+    '''
+    Inverse document frequency of a word or tag among the public posts of a
+    language, as of the last full computation of the related posts
+    '''
+    lang = models.CharField(max_length=7)
+    feature = models.CharField(max_length=100)
+    idf = models.FloatField()
+
+    class Meta:
+        unique_together = ('lang', 'feature')
+
+    def __unicode__(self):
+        return '%s: %s' % (self.lang, self.feature)
+
+
+class Tag(ChangeTrackingMixin, models.Model):
     name = models.CharField(max_length=50)
     slug = models.SlugField(
         blank=False, unique=True,
         help_text='Slug of the tag, used for URLs'
     )
 
+    cache_surfaces = {
+        'name': ('detail', 'list'),
+        'slug': ('detail', 'list'),
+    }
+
     def __unicode__(self):
         return self.name
 
+    @classmethod
+    def cached_list(cls):
+        '''
+        Returns all the tags ordered by name, cached until a tag changes
+        '''
+        key = 'blog_tags_%s' % get_version('tags')
+        tags = default_cache.get(key)
+        if tags is None:
+            tags = list(cls.objects.order_by('name'))
+            default_cache.set(key, tags, 60 * 60 * 24)
+        return tags
+
+    @staticmethod
+    def post_save_handler(sender, instance, created=False, **kwargs):
+        # All the tags are listed on the detail pages, so the archive cache
+        # is left alone and only the versions are bumped
+        surfaces = instance.changed_surfaces(created)
+        if surfaces:
+            bump_version('tags')
+        for surface in surfaces:
+            bump_version(surface)
+
+    @staticmethod
+    def post_delete_handler(sender, instance, **kwargs):
+        bump_version('tags')
+        for surface in instance.changed_surfaces(created=True):
+            bump_version(surface)
+
+
+class PostCount(models.Model):
+    '''
+    Number of public posts per language, maintained from the post signals
+    so that no aggregation is needed at request time
+    '''
+    lang = models.CharField(max_length=7)
+    count = models.PositiveIntegerField(default=0)
+
+    # Post field the posts are counted by, and the matching field here
+    relation_field = None
+    counted_field = None
+    # Post field the translations are counted by, if not the same
+    translation_relation_field = None
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def update(cls, ids=None):
+        '''
+        Recounts the posts of the given tags or categories, or of all of
+        them if ids is None
+        '''
+        existing = cls.objects.all()
+
+        if ids is not None:
+            ids = set(pk for pk in ids if pk is not None)
+            if not ids:
+                return
+            existing = existing.filter(**{'%s__in' % cls.counted_field: ids})
+
+        counts = Counter()
+        paths = (
+            (True, cls.relation_field),
+            (False, cls.translation_relation_field or cls.relation_field),
+        )
+        for is_source, field in paths:
+            qs = public_posts().filter(source__isnull=is_source)
+            if ids is not None:
+                qs = qs.filter(**{'%s__in' % field: ids})
+
+            rows = qs.order_by().values(field, 'lang').annotate(count=Count('pk', distinct=True))
+            for row in rows:
+                if row[field] is not None:
+                    counts[(row[field], row['lang'])] += row['count']
+
+        with transaction.atomic():
+            existing.delete()
+            cls.objects.bulk_create([
+                cls(**{cls.counted_field: pk, 'lang': lang, 'count': count})
+                for (pk, lang), count in counts.items()
+            ])
+
+        # The counts are shown on the detail pages
+        bump_version('counts')
+
+    @classmethod
+    def counts(cls, lang=None):
+        '''
+        Returns a dict of id: count for the given language (the active one
+        by default), falling back to the default language counts
+        '''
+        lang = lang or get_language()
+        counts = {}
+        rows = cls.objects.filter(lang__in=(lang, settings.LANGUAGE_CODE)).values_list(
+            cls.counted_field, 'lang', 'count')
+
+        for pk, row_lang, count in rows:
+            if row_lang == lang:
+                counts[pk] = count
+            else:
+                counts.setdefault(pk, count)
+
+        return counts
+
+
+class TagPostCount(PostCount):
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE)
+
+    relation_field = 'tags'
+    counted_field = 'tag_id'
+    # Translations have no tags of their own
+    translation_relation_field = 'source__tags'
+
+    class Meta:
+        unique_together = ('tag', 'lang')
+
+
+class CategoryPostCount(PostCount):
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+
+    relation_field = 'category'
+    counted_field = 'category_id'
+
+    class Meta:
+        unique_together = ('category', 'lang')
+
+
+class TaskRun(models.Model):
+    '''
+    Time of the last run of a periodic task, e.g. to process the posts
+    released since then
+    '''
+    name = models.CharField(max_length=100, primary_key=True)
+    last_run = models.DateTimeField()
+
+    def __unicode__(self):
+        return '%s: %s' % (self.name, self.last_run)
+
 
 signals.post_save.connect(Author.post_save_handler, sender=Author)
 signals.post_save.connect(Category.post_save_handler, sender=Category)
+signals.post_save.connect(Tag.post_save_handler, sender=Tag)
+signals.post_delete.connect(Tag.post_delete_handler, sender=Tag)
+
+for sender in (Post, PostProxy):
+    signals.post_save.connect(Post.post_save_handler, sender=sender)
+    signals.pre_delete.connect(Post.pre_delete_handler, sender=sender)
+    signals.post_delete.connect(Post.post_delete_handler, sender=sender)
+signals.m2m_changed.connect(Post.tags_changed_handler, sender=Post.tags.through)
+signals.post_save.connect(Post.banner_save_handler, sender=Image)
@@ -32,12 +32,12 @@
 from django.utils.translation import ugettext_noop as _
 
 from djangoplicity.archives.contrib.browsers import ListBrowser
-from djangoplicity.archives.contrib.queries.defaults import AllPublicQuery, \
-    EmbargoQuery
 from djangoplicity.archives.options import ArchiveOptions
 
-from djangoplicity.blog.queries import PostTagQuery
-from djangoplicity.blog.models import Tag
+from djangoplicity.blog.queries import PostEmbargoQuery, PostQuery, \
+    PostSearchQuery, PostTagQuery
+from djangoplicity.blog.models import Tag, TagPostCount
+from djangoplicity.blog.related import related_posts
 from djangoplicity.blog.views import PostDetailView
 
 
@@ -46,22 +46,31 @@ class PostOptions(ArchiveOptions):
     urlname_prefix = 'blog'
     template_name = 'archives/post/detail.html'
     detail_view = PostDetailView
-    select_related = ('banner', )
+    select_related = ('banner', 'category', 'source__banner', 'source__category')
     prefetch_related = ('tags', 'authordescription_set__author')
 
     class Queries(object):
-        default = AllPublicQuery(browsers=('normal', ), verbose_name=_('Blog Posts'), feed_name='default', select_related=['category'])
-        staging = EmbargoQuery(browsers=('normal', ), verbose_name=_('Blog Posts (Staging)'))
+        default = PostQuery(browsers=('normal', ), verbose_name=_('Blog Posts'), feed_name='default', select_related=['category'])
+        staging = PostEmbargoQuery(browsers=('normal', ), verbose_name=_('Blog Posts (Staging)'))
         tag = PostTagQuery(browsers=('normal', ), relation_field='tags', url_field='slug', title_field='name', use_category_title=True, verbose_name='%s')
         category = PostTagQuery(browsers=('normal', ), relation_field='category', url_field='slug', title_field='name', use_category_title=True, verbose_name='%s')
+        search = PostSearchQuery(browsers=('normal', ), verbose_name=_('Search results'))
 
     class Browsers(object):
         normal = ListBrowser()
 
     @staticmethod
     def extra_context( obj, lang=None ):
+        tags = Tag.cached_list()
+        counts = TagPostCount.counts(lang)
+        for tag in tags:
+            tag.post_count = counts.get(tag.pk, 0)
+
         return {
-            'tags': Tag.objects.order_by('name')
+            'tags': tags,
+            # The post tags are prefetched, so this doesn't need a query
+            'post_tag_ids': set(tag.pk for tag in obj.tags.all()),
+            'related_posts': related_posts(obj),
         }
 
     @staticmethod
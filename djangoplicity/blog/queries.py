@@ -30,14 +30,43 @@
 # POSSIBILITY OF SUCH DAMAGE
 
 
-from djangoplicity.archives.contrib.queries.defaults import CategoryQuery
+from djangoplicity.archives.contrib.queries.defaults import AllPublicQuery, \
+    CategoryQuery, EmbargoQuery
 
-from django.db.models import Q
+from django.db.models import Case, IntegerField, Q, Value, When
 
 from datetime import datetime
 
+# Objects shown in the lists, translations take the banner and category of
+# their source
+LIST_SELECT_RELATED = ('banner', 'category', 'source__banner', 'source__category')
+LIST_PREFETCH_RELATED = ('authordescription_set__author', )
 
-class PostTagQuery(CategoryQuery):
+
+def select_list_related(qs):
+    '''
+    Fetches the source of translations and the objects shown in the lists
+    along with the posts, so that resolving them doesn't cost queries per
+    post in non-default languages
+    '''
+    return qs.select_related(*LIST_SELECT_RELATED).prefetch_related(*LIST_PREFETCH_RELATED)
+
+
+class PostListQueryMixin(object):
+    def queryset(self, model, options, request, *args, **kwargs):
+        qs, query_data = super(PostListQueryMixin, self).queryset(model, options, request, *args, **kwargs)
+        return select_list_related(qs), query_data
+
+
+class PostQuery(PostListQueryMixin, AllPublicQuery):
+    pass
+
+
+class PostEmbargoQuery(PostListQueryMixin, EmbargoQuery):
+    pass
+
+
+class PostTagQuery(PostListQueryMixin, CategoryQuery):
     '''
     We override the queryset from the default CategoryQuery to
     exclude embargoed items
@@ -46,3 +75,40 @@ class PostTagQuery(CategoryQuery):
         qs, categories = super(PostTagQuery, self).queryset(model, options, request, stringparam)
 
         return (qs.filter(Q(release_date__lte=datetime.now()) | Q(release_date__isnull=True)), categories)
+
+
+class PostSearchQuery(PostListQueryMixin, AllPublicQuery):
+    '''
+    Public posts matching the ?q= search terms, best match first. Matching
+    translations are listed as their source post.
+    '''
+    max_results = 200
+
+    def queryset(self, model, options, request, **kwargs):
+        from djangoplicity.blog.models import Post
+        from djangoplicity.blog.search import cached_search
+
+        qs, query_data = super(PostSearchQuery, self).queryset(model, options, request, **kwargs)
+
+        term = request.GET.get('q', '') if request is not None else ''
+        hits, has_more = cached_search(term, per_page=self.max_results, snippets=False)
+        slugs = [slug for slug, snippet in hits]
+
+        # Map the matching translations to their source, keeping the rank
+        sources = dict(Post._base_manager.filter(pk__in=slugs).values_list('pk', 'source_id'))
+        ranked = []
+        seen = set()
+        for slug in slugs:
+            slug = sources.get(slug) or slug
+            if slug not in seen:
+                seen.add(slug)
+                ranked.append(slug)
+
+        if not ranked:
+            return qs.none(), query_data
+
+        rank = Case(
+            *[When(pk=slug, then=Value(i)) for i, slug in enumerate(ranked)],
+            output_field=IntegerField()
+        )
+        return qs.filter(pk__in=ranked).annotate(search_rank=rank).order_by('search_rank'), query_data
@@ -0,0 +1,452 @@
+# -*- coding: utf-8 -*-
+#
+# eso-blog
+# Copyright (c) 2007-2017, European Southern Observatory (ESO)
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#
+#   * Neither the name of the European Southern Observatory nor the names
+#     of its contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY ESO ``AS IS'' AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL ESO BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER
+# IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE
+
+'''
+Precomputed related posts. Each public post is described by a sparse
+vector of the TF-IDF weights of the words of its title, lede and body and
+of its tags, similar posts share many heavily weighted features. Posts of
+the same category or by the same authors get a bonus. The k most similar
+posts of the same language are stored in RelatedPost.
+
+The vectors are dicts and the scores are accumulated through an inverted
+index, so only posts sharing a feature are ever compared. rebuild()
+computes the vectors of all the posts, and stores them and the inverse
+document frequencies in RelatedFeature and RelatedIdf. update() then only
+computes the vectors of the changed posts, and finds the posts they are
+related to through the stored vectors of the posts sharing their features.
+'''
+from __future__ import unicode_literals
+
+from collections import Counter, defaultdict
+import heapq
+import logging
+import math
+from operator import itemgetter
+import re
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.html import strip_tags
+
+from djangoplicity.blog.cache import bump_version
+from djangoplicity.blog.models import Post, RelatedFeature, RelatedIdf, RelatedPost, public_posts
+
+logger = logging.getLogger(__name__)
+
+# Number of related posts stored per post
+TOP_K = getattr(settings, 'BLOG_RELATED_POSTS', 5)
+
+# Share of each kind of feature in the similarity score
+WEIGHTS = {
+    'text': 0.5,
+    'tags': 0.3,
+    'category': 0.1,
+    'authors': 0.1,
+}
+
+# Only the highest weighted words of each post are kept, and words used in
+# more than this share of the posts are ignored
+MAX_TERMS = 50
+MAX_DF = 0.5
+
+# Longest word kept, see RelatedFeature.feature
+MAX_WORD_LENGTH = 100
+
+# Number of values in the IN clauses
+CHUNK_SIZE = 500
+
+WORD_RE = re.compile(r'\w{3,}', re.UNICODE)
+
+
+def tokenize(text):
+    return [
+        word for word in WORD_RE.findall(strip_tags(text).lower())
+        if not word.isdigit() and len(word) <= MAX_WORD_LENGTH
+    ]
+
+
+def normalize(vector, weight):
+    '''
+    Scales the vector to a norm of sqrt(weight), so that the dot product of
+    two vectors is their cosine similarity times the weight
+    '''
+    norm = math.sqrt(sum(value * value for value in vector.values()))
+    if not norm:
+        return {}
+    scale = math.sqrt(weight) / norm
+    return dict((feature, value * scale) for feature, value in vector.items())
+
+
+def chunks(items, size=CHUNK_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class RelatedIndex(object):
+    '''
+    Vectors of public posts of one language. build() computes the vectors
+    of all of them, vectorize() and load() only the ones needed to update
+    the related posts of a few posts.
+    '''
+    def __init__(self, lang):
+        self.lang = lang
+        self.idf = {}
+        self.vectors = {}
+        self.postings = defaultdict(dict)
+        self.categories = {}
+        self.authors = {}
+        self.loaded_features = set()
+
+    def describe(self, slugs):
+        '''
+        Records the category and authors of the given posts, and returns a
+        dict of slug: tag features. Translations use the tags, category and
+        authors of their source.
+        '''
+        sources = {}
+        for chunk in chunks(slugs):
+            sources.update(Post._base_manager.filter(pk__in=chunk).values_list('pk', 'source_id'))
+        source_ids = set(source_id or slug for slug, source_id in sources.items())
+
+        tags = defaultdict(list)
+        authors = defaultdict(set)
+        categories = {}
+        for chunk in chunks(source_ids):
+            posts = Post._base_manager.filter(pk__in=chunk)
+            for slug, tag_id in posts.filter(tags__isnull=False).values_list('pk', 'tags'):
+                tags[slug].append('tag:%s' % tag_id)
+            for slug, author_id in posts.filter(authors__isnull=False).values_list('pk', 'authors'):
+                authors[slug].add(author_id)
+            categories.update(posts.values_list('pk', 'category_id'))
+
+        features = {}
+        for slug, source_id in sources.items():
+            source_id = source_id or slug
+            self.categories[slug] = categories.get(source_id)
+            self.authors[slug] = authors[source_id]
+            features[slug] = tags[source_id]
+        return features
+
+    @staticmethod
+    def words(posts):
+        '''
+        Returns a dict of slug: word counts of the given posts
+        '''
+        words = {}
+        rows = posts.values_list('pk', 'title', 'subtitle', 'lede', 'body').iterator()
+        for slug, title, subtitle, lede, body in rows:
+            # The title counts double
+            words[slug] = Counter(tokenize(' '.join((title, title, subtitle, lede, body))))
+        return words
+
+    def add(self, slug, counts, tags):
+        text = dict(
+            (word, (1 + math.log(count)) * self.idf[word])
+            for word, count in counts.items() if word in self.idf
+        )
+        if len(text) > MAX_TERMS:
+            text = dict(heapq.nlargest(MAX_TERMS, text.items(), key=itemgetter(1)))
+
+        vector = normalize(text, WEIGHTS['text'])
+        vector.update(normalize(
+            dict((tag, self.idf[tag]) for tag in tags if tag in self.idf),
+            WEIGHTS['tags']
+        ))
+
+        self.vectors[slug] = vector
+        for feature, value in vector.items():
+            self.postings[feature][slug] = value
+
+    def build(self):
+        '''
+        Computes the vectors of all the public posts of the language
+        '''
+        posts = public_posts().filter(lang=self.lang)
+        words = self.words(posts)
+        tags = self.describe(words)
+
+        df = Counter()
+        for slug, counts in words.items():
+            df.update(counts.keys())
+            df.update(tags[slug])
+
+        total = len(words)
+        self.idf = dict(
+            (feature, math.log((1.0 + total) / (1 + count)) + 1)
+            for feature, count in df.items()
+            # Features of a single post can't make it similar to another
+            if count > 1 and count <= max(MAX_DF * total, 2)
+        )
+
+        for slug, counts in words.items():
+            self.add(slug, counts, tags[slug])
+        self.loaded_features = set(self.postings)
+
+        return self
+
+    def vectorize(self, slugs):
+        '''
+        Computes the vectors of the given posts which are public, with the
+        inverse document frequencies stored by the last rebuild()
+        '''
+        words = {}
+        for chunk in chunks(slugs):
+            words.update(self.words(public_posts().filter(lang=self.lang, pk__in=chunk)))
+        tags = self.describe(words)
+
+        features = set()
+        for slug, counts in words.items():
+            features.update(counts)
+            features.update(tags[slug])
+        for chunk in chunks(features - set(self.idf)):
+            self.idf.update(RelatedIdf.objects.filter(lang=self.lang, feature__in=chunk).values_list('feature', 'idf'))
+
+        for slug, counts in words.items():
+            self.add(slug, counts, tags[slug])
+
+    def load(self, slugs):
+        '''
+        Loads the stored vectors of the given posts, and the stored vectors
+        of the posts sharing a feature with them so that they can be scored
+        '''
+        for chunk in chunks(set(slugs) - set(self.vectors)):
+            rows = RelatedFeature.objects.filter(post__in=chunk).values_list('post', 'feature', 'weight')
+            for slug, feature, weight in rows:
+                self.vectors.setdefault(slug, {})[feature] = weight
+
+        features = set()
+        for slug in slugs:
+            features.update(self.vectors.get(slug, {}))
+        features -= self.loaded_features
+
+        for chunk in chunks(features):
+            rows = (
+                RelatedFeature.objects.filter(feature__in=chunk, post__lang=self.lang)
+                .values_list('feature', 'post', 'weight')
+            )
+            for feature, slug, weight in rows:
+                self.postings[feature][slug] = weight
+        self.loaded_features.update(features)
+
+        others = set()
+        for feature in features:
+            others.update(self.postings[feature])
+        self.describe(others - set(self.categories))
+
+    def scores(self, slug):
+        '''
+        Returns a dict of slug: similarity to the given post, for all the
+        posts sharing a feature with it
+        '''
+        scores = defaultdict(float)
+        for feature, value in self.vectors.get(slug, {}).items():
+            for other, other_value in self.postings[feature].items():
+                scores[other] += value * other_value
+        scores.pop(slug, None)
+
+        category = self.categories.get(slug)
+        authors = self.authors.get(slug)
+        for other in scores:
+            if category is not None and self.categories[other] == category:
+                scores[other] += WEIGHTS['category']
+            if authors and self.authors[other]:
+                shared = len(authors & self.authors[other])
+                if shared:
+                    scores[other] += WEIGHTS['authors'] * shared / len(authors | self.authors[other])
+
+        return scores
+
+    def neighbours(self, slug, k=TOP_K):
+        return heapq.nlargest(k, self.scores(slug).items(), key=itemgetter(1))
+
+
+def save(related):
+    '''
+    Replaces the related posts of the posts of the given dict of slug:
+    [(related slug, score)]
+    '''
+    rows = [
+        RelatedPost(post_id=slug, related_id=other, score=score)
+        for slug, neighbours in related.items() for other, score in neighbours
+    ]
+
+    with transaction.atomic():
+        for chunk in chunks(related):
+            RelatedPost.objects.filter(post__in=chunk).delete()
+        RelatedPost.objects.bulk_create(rows, batch_size=1000)
+
+    # The related posts are shown on the detail pages
+    bump_version('related')
+
+
+def store(index, slugs):
+    '''
+    Replaces the related posts of the given posts
+    '''
+    save(dict((slug, index.neighbours(slug)) for slug in slugs))
+
+
+def store_features(index, slugs):
+    '''
+    Replaces the stored vectors of the given posts, removing the ones of
+    the posts which are not in the index
+    '''
+    rows = [
+        RelatedFeature(post_id=slug, feature=feature, weight=weight)
+        for slug in slugs for feature, weight in index.vectors.get(slug, {}).items()
+    ]
+
+    with transaction.atomic():
+        for chunk in chunks(slugs):
+            RelatedFeature.objects.filter(post__in=chunk).delete()
+        RelatedFeature.objects.bulk_create(rows, batch_size=1000)
+
+
+def rebuild(lang=None, chunk_size=1000):
+    '''
+    Recomputes the related posts of all the public posts of the given
+    language, of all languages if None
+    '''
+    langs = [lang] if lang else Post._base_manager.order_by().values_list('lang', flat=True).distinct()
+
+    count = 0
+    for lang in langs:
+        index = RelatedIndex(lang).build()
+
+        with transaction.atomic():
+            RelatedFeature.objects.filter(post__lang=lang).delete()
+            RelatedIdf.objects.filter(lang=lang).delete()
+            RelatedIdf.objects.bulk_create([
+                RelatedIdf(lang=lang, feature=feature, idf=idf) for feature, idf in index.idf.items()
+            ], batch_size=1000)
+
+        slugs = sorted(index.vectors)
+        for start in range(0, len(slugs), chunk_size):
+            store(index, slugs[start:start + chunk_size])
+            store_features(index, slugs[start:start + chunk_size])
+
+        # Posts which are no longer public
+        RelatedPost.objects.filter(post__lang=lang).exclude(post__in=public_posts()).delete()
+        count += len(slugs)
+
+    logger.info('Computed the related posts of %d posts', count)
+    return count
+
+
+def update(slugs):
+    '''
+    Recomputes the related posts of the given posts, and of the posts whose
+    related posts they were or should now be part of. Only the vectors of
+    the given posts are computed, the ones of the other posts are loaded.
+    '''
+    count = 0
+
+    # Translations share the tags and category of their source
+    by_lang = defaultdict(set)
+    for chunk in chunks(slugs):
+        rows = Post._base_manager.filter(Q(pk__in=chunk) | Q(source__in=chunk)).values_list('pk', 'lang')
+        for slug, lang in rows:
+            by_lang[lang].add(slug)
+
+    for lang, changed in by_lang.items():
+        if not RelatedIdf.objects.filter(lang=lang).exists():
+            # Nothing was computed yet for the language
+            count += rebuild(lang)
+            continue
+
+        index = RelatedIndex(lang)
+        index.vectorize(changed)
+        public = set(index.vectors)
+        store_features(index, changed)
+        index.load(public)
+
+        # The score of the changed posts may have dropped, the posts they
+        # were related to are recomputed
+        previous = set()
+        for chunk in chunks(changed):
+            previous.update(RelatedPost.objects.filter(related__in=chunk).values_list('post_id', flat=True))
+        previous -= changed
+        index.load(previous)
+
+        related = dict(
+            (slug, index.neighbours(slug)) for slug in public | previous if slug in index.vectors
+        )
+
+        # The similarity is symmetric, the changed posts are merged into the
+        # related posts of the other posts sharing a feature with them
+        candidates = defaultdict(dict)
+        for slug in public:
+            for other, score in index.scores(slug).items():
+                if other not in related and other not in changed:
+                    candidates[other][slug] = score
+
+        current = defaultdict(dict)
+        for chunk in chunks(candidates):
+            rows = RelatedPost.objects.filter(post__in=chunk).values_list('post', 'related', 'score')
+            for slug, other, score in rows:
+                current[slug][other] = score
+
+        for slug, scores in candidates.items():
+            merged = dict(current[slug])
+            merged.update(scores)
+            neighbours = heapq.nlargest(TOP_K, merged.items(), key=itemgetter(1))
+            if dict(neighbours) != current[slug]:
+                related[slug] = neighbours
+
+        save(related)
+
+        # Posts which are no longer public
+        for chunk in chunks(changed - public):
+            RelatedPost.objects.filter(post__in=chunk).delete()
+        count += len(related)
+
+    return count
+
+
+def related_posts(post, limit=TOP_K):
+    '''
+    Returns the public related posts of the given post, in one query
+    '''
+    now = timezone.now()
+    rows = (
+        RelatedPost.objects.filter(post=post, related__published=True)
+        .filter(Q(related__release_date__lte=now) | Q(related__release_date__isnull=True))
+        .select_related('related')
+        .defer(
+            'related__body', 'related__rendered_body', 'related__discover_box',
+            'related__numbers_box', 'related__profile', 'related__links',
+        )
+        .order_by('-score')[:limit]
+    )
+    return [row.related for row in rows]
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+#
+# eso-blog
+# Copyright (c) 2007-2017, European Southern Observatory (ESO)
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#
+#   * Neither the name of the European Southern Observatory nor the names
+#     of its contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY ESO ``AS IS'' AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL ESO BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER
+# IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE
+
+'''
+Full-text index of the posts, kept in the blog_post_search table (created
+by migration 0014) which is maintained on save. Title (and slug, subtitle) are weighted over the lede,
+itself weighted over the body and boxes. PostgreSQL uses a tsvector with
+the text search configuration of the language of each post, SQLite an FTS5
+virtual table (stemming English only) so that it can be used locally.
+'''
+from __future__ import unicode_literals
+
+import hashlib
+
+from django.conf import settings
+from django.db import connection
+from django.utils.html import escape, strip_tags
+from django.utils.safestring import mark_safe
+
+from djangoplicity.blog.cache import default_cache, get_version
+
+TABLE = 'blog_post_search'
+SEARCH_CACHE_TIMEOUT = getattr(settings, 'BLOG_SEARCH_CACHE_TIMEOUT', 5 * 60)
+
+# Markers of the matches in snippets, replaced after escaping the text
+MARK_START = '\x02'
+MARK_STOP = '\x03'
+
+# PostgreSQL text search configurations
+LANGUAGE_CONFIGS = {
+    'da': 'danish',
+    'de': 'german',
+    'en': 'english',
+    'es': 'spanish',
+    'fi': 'finnish',
+    'fr': 'french',
+    'hu': 'hungarian',
+    'it': 'italian',
+    'nl': 'dutch',
+    'no': 'norwegian',
+    'pt': 'portuguese',
+    'ro': 'romanian',
+    'ru': 'russian',
+    'sv': 'swedish',
+    'tr': 'turkish',
+}
+
+
+def language_config(lang):
+    return LANGUAGE_CONFIGS.get((lang or settings.LANGUAGE_CODE).split('-')[0], 'simple')
+
+
+def post_document(post):
+    '''
+    Returns the (title, lede, body) texts of the post to index, by weight
+    '''
+    title = ' '.join((post.slug, post.title, post.subtitle))
+    body = ' '.join(strip_tags(text) for text in (
+        post.body, post.discover_box, post.numbers_box, post.links))
+    return title, post.lede, body
+
+
+class PostgreSQLSearchBackend(object):
+    def index(self, cursor, posts):
+        for post in posts:
+            config = language_config(post.lang)
+            title, lede, body = post_document(post)
+            cursor.execute(
+                'INSERT INTO ' + TABLE + ' (slug, lang, document) VALUES (%s, %s,'
+                ' setweight(to_tsvector(%s::regconfig, %s), \'A\') ||'
+                ' setweight(to_tsvector(%s::regconfig, %s), \'B\') ||'
+                ' setweight(to_tsvector(%s::regconfig, %s), \'C\'))'
+                ' ON CONFLICT (slug) DO UPDATE SET lang = EXCLUDED.lang, document = EXCLUDED.document',
+                [post.pk, post.lang, config, title, config, lede, config, body]
+            )
+
+    @staticmethod
+    def tsquery(query, lang=None):
+        '''
+        Parses the query with the configuration of the given language, or
+        of all the site languages. The result is constant so that the GIN
+        index can be used.
+        '''
+        if lang:
+            configs = [language_config(lang)]
+        else:
+            configs = sorted(set(language_config(code) for code, name in settings.LANGUAGES))
+        sql = ' || '.join(['plainto_tsquery(%s::regconfig, %s)'] * len(configs))
+        params = []
+        for config in configs:
+            params += [config, query]
+        return '(%s)' % sql, params
+
+    def match_sql(self, query, lang=None):
+        '''
+        Returns the SQL and parameters selecting the slugs of the matching
+        posts
+        '''
+        tsquery, params = self.tsquery(query, lang)
+        sql = 'SELECT slug FROM ' + TABLE + ' WHERE document @@ ' + tsquery
+        if lang:
+            sql += ' AND lang = %s'
+            params.append(lang)
+        return sql, params
+
+    def search(self, cursor, query, lang=None, limit=20, offset=0, within=None):
+        sql, params = self.match_sql(query, lang)
+        if within is not None:
+            sql += ' AND slug IN (%s)' % within[0]
+            params += list(within[1])
+        tsquery, rank_params = self.tsquery(query, lang)
+        cursor.execute(
+            sql + ' ORDER BY ts_rank(document, ' + tsquery + ') DESC, slug LIMIT %s OFFSET %s',
+            params + rank_params + [limit, offset]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+    def snippets(self, cursor, query, slugs, lang=None):
+        '''
+        Returns a dict of slug: highlighted body excerpt, computed by the
+        database so that the bodies are not loaded
+        '''
+        tsquery, params = self.tsquery(query, lang)
+        cursor.execute(
+            'SELECT slug, ts_headline(%s::regconfig, regexp_replace(body, \'<[^>]+>\', \' \', \'g\'), '
+            + tsquery + ', %s) FROM blog_post WHERE slug IN (' + ', '.join(['%s'] * len(slugs)) + ')',
+            [language_config(lang)] + params
+            + ['MaxFragments=2, MaxWords=20, MinWords=8, StartSel=%s, StopSel=%s' % (MARK_START, MARK_STOP)]
+            + list(slugs)
+        )
+        return dict(cursor.fetchall())
+
+
+class SQLiteSearchBackend(object):
+    @staticmethod
+    def parse(query):
+        # Quote the terms so that FTS5 operators are searched as text
+        return ' '.join('"%s"' % term.replace('"', '""') for term in query.split())
+
+    def index(self, cursor, posts):
+        for post in posts:
+            cursor.execute('DELETE FROM ' + TABLE + ' WHERE slug = %s', [post.pk])
+            cursor.execute(
+                'INSERT INTO ' + TABLE + ' (slug, lang, title, lede, body) VALUES (%s, %s, %s, %s, %s)',
+                [post.pk, post.lang] + list(post_document(post))
+            )
+
+    def match_sql(self, query, lang=None):
+        sql = 'SELECT slug FROM ' + TABLE + ' WHERE ' + TABLE + ' MATCH %s'
+        params = [self.parse(query)]
+        if lang:
+            sql += ' AND lang = %s'
+            params.append(lang)
+        return sql, params
+
+    def search(self, cursor, query, lang=None, limit=20, offset=0, within=None):
+        sql, params = self.match_sql(query, lang)
+        if within is not None:
+            sql += ' AND slug IN (%s)' % within[0]
+            params += list(within[1])
+        cursor.execute(
+            sql + ' ORDER BY bm25(' + TABLE + ', 0.0, 0.0, 10.0, 5.0, 1.0), slug LIMIT %s OFFSET %s',
+            params + [limit, offset]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+    def snippets(self, cursor, query, slugs, lang=None):
+        sql, params = self.match_sql(query, lang)
+        cursor.execute(
+            sql.replace('SELECT slug FROM', 'SELECT slug, snippet(' + TABLE + ', 4, %s, %s, %s, 24) FROM', 1)
+            + ' AND slug IN (' + ', '.join(['%s'] * len(slugs)) + ')',
+            [MARK_START, MARK_STOP, '\u2026'] + params + list(slugs)
+        )
+        return dict(cursor.fetchall())
+
+
+BACKENDS = {
+    'postgresql': PostgreSQLSearchBackend,
+    'sqlite': SQLiteSearchBackend,
+}
+
+
+def get_backend(vendor=None):
+    '''
+    Returns the search backend for the database, None if not supported
+    '''
+    backend = BACKENDS.get(vendor or connection.vendor)
+    return backend() if backend else None
+
+
+def index_posts(posts):
+    backend = get_backend()
+    if backend is not None:
+        with connection.cursor() as cursor:
+            backend.index(cursor, posts)
+
+
+def unindex_posts(slugs):
+    if get_backend() is not None and slugs:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM ' + TABLE + ' WHERE slug IN (%s)' % ', '.join(['%s'] * len(slugs)),
+                list(slugs)
+            )
+
+
+def search_posts(query, lang=None, limit=20, offset=0, public=False):
+    '''
+    Returns the slugs of the posts matching the query, best match first,
+    only the published and non embargoed ones if public is True
+    '''
+    backend = get_backend()
+    if backend is None or not query.strip():
+        return []
+
+    within = None
+    if public:
+        from djangoplicity.blog.models import public_posts
+        within = public_posts().values('pk').query.sql_with_params()
+
+    with connection.cursor() as cursor:
+        return backend.search(cursor, query, lang, limit, offset, within)
+
+
+def highlight(snippet):
+    return mark_safe(escape(snippet).replace(MARK_START, '<mark>').replace(MARK_STOP, '</mark>'))
+
+
+def cached_search(query, lang=None, page=1, per_page=20, snippets=True):
+    '''
+    Returns a page of the public posts matching the query as a list of
+    (slug, highlighted snippet), and whether there are more pages. Results
+    are cached for a short time and until posts are reindexed, published
+    or released (the 'search' version). The snippets are left empty if
+    snippets is False.
+    '''
+    query = ' '.join(query.split())
+    if not query or get_backend() is None:
+        return [], False
+
+    key = 'blog_search_%s' % hashlib.md5('|'.join(
+        '%s' % part for part in (query, lang, page, per_page, snippets, get_version('search'))
+    ).encode('utf-8')).hexdigest()
+
+    result = default_cache.get(key)
+    if result is None:
+        slugs = search_posts(query, lang, per_page + 1, (page - 1) * per_page, public=True)
+        has_more = len(slugs) > per_page
+        slugs = slugs[:per_page]
+
+        excerpts = {}
+        if slugs and snippets:
+            with connection.cursor() as cursor:
+                excerpts = get_backend().snippets(cursor, query, slugs, lang)
+
+        result = ([(slug, highlight(excerpts.get(slug) or '')) for slug in slugs], has_more)
+        default_cache.set(key, result, SEARCH_CACHE_TIMEOUT)
+
+    return result
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+#
+# eso-blog
+# Copyright (c) 2007-2017, European Southern Observatory (ESO)
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#
+#   * Neither the name of the European Southern Observatory nor the names
+#     of its contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY ESO ``AS IS'' AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL ESO BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER
+# IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE
+
+'''
+Sitemap index of the blog with chunked child sitemaps of the public posts
+of each language (with hreflang alternates), of the tags and of the
+categories. Unlike django.contrib.sitemaps no model instance is created:
+rows are read with values() and the URLs are built from the patterns
+cached by url_builder. Each chunk is cached under the versions of the
+surfaces listing the posts and their counts, so it is only rebuilt once
+posts change and no query is run until then.
+'''
+from __future__ import unicode_literals
+
+from collections import defaultdict
+from xml.sax.saxutils import escape, quoteattr
+
+from django.conf import settings
+from django.core.urlresolvers import reverse
+from django.db.models import Count, Max, Q
+from django.http import Http404, HttpResponse
+
+from djangoplicity.blog.cache import default_cache, get_version
+from djangoplicity.blog.models import Category, Tag, public_posts
+from djangoplicity.blog.utils import url_builder
+
+SITEMAP_CHUNK_SIZE = getattr(settings, 'BLOG_SITEMAP_CHUNK_SIZE', 5000)
+SITEMAP_CACHE_TIMEOUT = getattr(settings, 'BLOG_SITEMAP_CACHE_TIMEOUT', 24 * 60 * 60)
+
+XMLNS = 'xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"'
+XMLNS_XHTML = 'xmlns:xhtml="http://www.w3.org/1999/xhtml"'
+
+
+def _sections():
+    '''
+    Returns a list of (section, number of chunks)
+    '''
+    sections = []
+    counts = public_posts().order_by('lang').values('lang').annotate(count=Count('pk'))
+    for row in counts:
+        sections.append(('posts-%s' % row['lang'], row['count']))
+    sections.append(('tags', _tags().count()))
+    sections.append(('categories', _categories().count()))
+
+    return [
+        (section, (count - 1) // SITEMAP_CHUNK_SIZE + 1)
+        for section, count in sections if count
+    ]
+
+
+def _tags():
+    return Tag.objects.filter(tagpostcount__lang=settings.LANGUAGE_CODE, tagpostcount__count__gt=0)
+
+
+def _categories():
+    return Category.objects.filter(
+        categorypostcount__lang=settings.LANGUAGE_CODE, categorypostcount__count__gt=0)
+
+
+def _url(loc, lastmod=None, alternates=()):
+    xml = '<url><loc>%s</loc>' % escape(loc)
+    if lastmod is not None:
+        xml += '<lastmod>%s</lastmod>' % lastmod.strftime('%Y-%m-%d')
+    for lang, href in alternates:
+        xml += '<xhtml:link rel="alternate" hreflang=%s href=%s/>' % (quoteattr(lang), quoteattr(href))
+    return xml + '</url>'
+
+
+def _urlset(urls):
+    return '<?xml version="1.0" encoding="UTF-8"?>\n<urlset %s %s>%s</urlset>' % (
+        XMLNS, XMLNS_XHTML, ''.join(urls))
+
+
+def _posts_chunk(lang, page):
+    rows = list(
+        public_posts().filter(lang=lang).order_by('pk')
+        .values_list('pk', 'source_id', 'last_modified')[(page - 1) * SITEMAP_CHUNK_SIZE:page * SITEMAP_CHUNK_SIZE]
+    )
+    if not rows:
+        raise Http404
+
+    # The languages each post is available in, translations share the
+    # slug of their source in the URL
+    groups = set(source_id or slug for slug, source_id, last_modified in rows)
+    langs = defaultdict(list)
+    variants = (
+        public_posts().filter(Q(pk__in=groups) | Q(source__in=groups))
+        .order_by('lang').values_list('pk', 'source_id', 'lang')
+    )
+    for slug, source_id, variant_lang in variants:
+        langs[source_id or slug].append(variant_lang)
+
+    urls = []
+    for slug, source_id, last_modified in rows:
+        group = source_id or slug
+        alternates = [
+            (variant_lang, url_builder.absolute(url_builder.reverse('blog_detail', group, variant_lang)))
+            for variant_lang in langs[group]
+        ] if len(langs[group]) > 1 else ()
+        urls.append(_url(
+            url_builder.absolute(url_builder.reverse('blog_detail', group, lang)),
+            last_modified, alternates
+        ))
+
+    return _urlset(urls)
+
+
+def _slugs_chunk(qs, relation, urlname, page):
+    '''
+    Returns the chunk of the tags or categories, last modified when the
+    latest of their public posts was
+    '''
+    slugs = list(qs.order_by('slug').values_list('slug', flat=True)[
+        (page - 1) * SITEMAP_CHUNK_SIZE:page * SITEMAP_CHUNK_SIZE])
+    if not slugs:
+        raise Http404
+
+    field = relation + '__slug'
+    lastmods = dict(
+        public_posts().filter(**{field + '__in': slugs}).order_by()
+        .values(field).annotate(lastmod=Max('last_modified')).values_list(field, 'lastmod')
+    )
+
+    return _urlset(
+        _url(url_builder.absolute(url_builder.reverse(urlname, slug)), lastmods.get(slug))
+        for slug in slugs
+    )
+
+
+def _chunk_key(section, page):
+    '''
+    Saving a post or adding a translation bumps the 'list' or 'detail'
+    version, the post counts are updated when posts are released
+    '''
+    return 'blog_sitemap_%s_%d_%s_%s_%s' % (
+        section, page, get_version('list'), get_version('detail'), get_version('counts'))
+
+
+def sitemap_index(request, **kwargs):
+    sitemaps = []
+    for section, chunks in _sections():
+        for page in range(1, chunks + 1):
+            loc = url_builder.absolute(reverse('blog_sitemap_section', kwargs={
+                'section': section, 'page': page}))
+            sitemaps.append('<sitemap><loc>%s</loc></sitemap>' % escape(loc))
+
+    xml = '<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex %s>%s</sitemapindex>' % (
+        XMLNS, ''.join(sitemaps))
+    return HttpResponse(xml, content_type='application/xml')
+
+
+def sitemap_section(request, section, page, **kwargs):
+    page = int(page)
+    if page < 1:
+        raise Http404
+
+    key = _chunk_key(section, page)
+    xml = default_cache.get(key)
+    if xml is None:
+        if section.startswith('posts-'):
+            xml = _posts_chunk(section[len('posts-'):], page)
+        elif section == 'tags':
+            xml = _slugs_chunk(_tags(), 'tags', 'blog_query_tag', page)
+        elif section == 'categories':
+            xml = _slugs_chunk(_categories(), 'category', 'blog_query_category', page)
+        else:
+            raise Http404
+        default_cache.set(key, xml, SITEMAP_CACHE_TIMEOUT)
+
+    return HttpResponse(xml, content_type='application/xml')
@@ -0,0 +1,99 @@
+/*
+ * Autocompletion of the selects of the blog admin (see
+ * djangoplicity.blog.widgets): only the selected options are rendered, the
+ * others are searched by prefix while typing in the field added above them.
+ */
+(function () {
+    'use strict';
+
+    var DELAY = 250;
+
+    function setup(select) {
+        var url = select.getAttribute('data-autocomplete-url');
+        var input = document.createElement('input');
+        var more = document.createElement('a');
+        var timer = null;
+        var request = null;
+        var term = '';
+        var page = 1;
+
+        input.type = 'text';
+        input.className = 'vTextField blog-autocomplete-search';
+        input.placeholder = 'Search';
+        select.parentNode.insertBefore(input, select);
+
+        more.href = '#';
+        more.textContent = 'More';
+        more.style.display = 'none';
+        select.parentNode.insertBefore(more, select.nextSibling);
+
+        function load(append) {
+            if (request) {
+                request.abort();
+            }
+            request = new XMLHttpRequest();
+            request.open('GET', url + '?term=' + encodeURIComponent(term) + '&page=' + page);
+            request.onload = function () {
+                if (request.status !== 200) {
+                    return;
+                }
+                var data = JSON.parse(request.responseText);
+                var i;
+
+                // Keep the selected options and the empty one
+                if (!append) {
+                    for (i = select.options.length - 1; i >= 0; i--) {
+                        if (!select.options[i].selected && select.options[i].value !== '') {
+                            select.remove(i);
+                        }
+                    }
+                }
+
+                data.results.forEach(function (item) {
+                    var value = String(item.id);
+                    for (i = 0; i < select.options.length; i++) {
+                        if (select.options[i].value === value) {
+                            return;
+                        }
+                    }
+                    select.add(new Option(item.text, value));
+                });
+
+                more.style.display = data.more ? '' : 'none';
+            };
+            request.send();
+        }
+
+        input.addEventListener('input', function () {
+            clearTimeout(timer);
+            timer = setTimeout(function () {
+                term = input.value.trim();
+                page = 1;
+                load(false);
+            }, DELAY);
+        });
+
+        more.addEventListener('click', function (event) {
+            event.preventDefault();
+            page += 1;
+            load(true);
+        });
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        Array.prototype.forEach.call(document.querySelectorAll('select.blog-autocomplete'), function (select) {
+            // The empty form of inlines is set up once copied
+            if (select.name.indexOf('__prefix__') === -1) {
+                setup(select);
+            }
+        });
+    });
+
+    if (window.django && window.django.jQuery) {
+        window.django.jQuery(document).on('formset:added', function (event, $row) {
+            $row.find('select.blog-autocomplete').each(function () {
+                setup(this);
+            });
+        });
+    }
+})();
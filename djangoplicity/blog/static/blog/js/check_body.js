@@ -0,0 +1,94 @@
+/*
+ * Checks the body template of the post while it is edited, and shows the
+ * syntax error if any below the field. The check is debounced and the same
+ * body is never sent twice in a row.
+ */
+(function () {
+    'use strict';
+
+    var DELAY = 1000;
+    var script = document.currentScript;
+
+    function setup() {
+        var url = script.getAttribute('data-url');
+        var textarea = document.getElementById('id_body');
+        if (!url || !textarea) {
+            return;
+        }
+
+        var form = textarea.form;
+        var status = document.createElement('div');
+        var timer = null;
+        var request = null;
+        var checked = null;
+
+        status.className = 'blog-body-check';
+        textarea.parentNode.appendChild(status);
+
+        function body() {
+            var editor = window.tinymce && window.tinymce.get('id_body');
+            return editor ? editor.getContent() : textarea.value;
+        }
+
+        function show(data) {
+            status.textContent = '';
+            if (data.valid) {
+                return;
+            }
+            var error = data.error;
+            var message = document.createElement('p');
+            message.className = 'errornote';
+            message.textContent = (error.line ? 'Line ' + error.line + ': ' : '') + error.message +
+                (error.token ? ' (' + error.token + ')' : '');
+            status.appendChild(message);
+        }
+
+        function check() {
+            var value = body();
+            if (value === checked) {
+                return;
+            }
+            checked = value;
+
+            if (request) {
+                request.abort();
+            }
+            var data = new FormData();
+            data.append('body', value);
+            data.append('csrfmiddlewaretoken', form.elements.csrfmiddlewaretoken.value);
+
+            request = new XMLHttpRequest();
+            request.open('POST', url);
+            request.onload = function () {
+                if (request.status === 200) {
+                    show(JSON.parse(request.responseText));
+                }
+            };
+            request.send(data);
+        }
+
+        function changed() {
+            clearTimeout(timer);
+            timer = setTimeout(check, DELAY);
+        }
+
+        textarea.addEventListener('input', changed);
+        // The rich text editor is initialized after the page is loaded
+        var attached = null;
+        var poll = setInterval(function () {
+            var editor = window.tinymce && window.tinymce.get('id_body');
+            if (editor && editor !== attached) {
+                attached = editor;
+                editor.on('change keyup', changed);
+                clearInterval(poll);
+            }
+        }, 500);
+        setTimeout(function () {
+            clearInterval(poll);
+        }, 10000);
+
+        check();
+    }
+
+    document.addEventListener('DOMContentLoaded', setup);
+})();
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+#
+# eso-blog
+# Copyright (c) 2007-2017, European Southern Observatory (ESO)
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#
+#   * Neither the name of the European Southern Observatory nor the names
+#     of its contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY ESO ``AS IS'' AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL ESO BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER
+# IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE
+
+from __future__ import unicode_literals
+
+import logging
+import mimetypes
+
+from celery import shared_task
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, TextField, Value, When
+from django.template.base import TemplateSyntaxError
+from django.utils import timezone
+
+from djangoplicity.archives.base import cache_handler
+
+from djangoplicity.blog import related
+from djangoplicity.blog.cache import bump_version, default_cache, get_version, payload_cache_key
+from djangoplicity.blog.feeds import generate_static_feed
+from djangoplicity.blog.models import CategoryPostCount, Post, PostEnclosure, TagPostCount, TaskRun, \
+    invalidate_posts, run_task
+from djangoplicity.blog.search import index_posts
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def render_posts(slugs=None, chunk_size=100):
+    '''
+    Re-renders the stored body of the given posts (all posts and
+    translations if None), e.g. after the blog_utils template tags changed.
+    Each chunk is written with a single UPDATE and its cached pages are
+    invalidated.
+    '''
+    qs = Post._base_manager.order_by('pk').only('slug', 'body')
+    if slugs is not None:
+        qs = qs.filter(pk__in=slugs)
+
+    rendered = 0
+    last = None
+    while True:
+        chunk = list((qs.filter(pk__gt=last) if last is not None else qs)[:chunk_size])
+        if not chunk:
+            break
+
+        bodies = {}
+        for post in chunk:
+            try:
+                bodies[post.pk] = post.render_body()
+            except TemplateSyntaxError as e:
+                logger.warning('Could not render body of post %s: %s', post.pk, e)
+                bodies[post.pk] = ''
+
+        # Use update() so that last_modified and the signals are left alone
+        pks = list(bodies)
+        Post._base_manager.filter(pk__in=pks).update(rendered_body=Case(
+            *[When(pk=pk, then=Value(html)) for pk, html in bodies.items()],
+            output_field=TextField()
+        ))
+        invalidate_posts(Post._base_manager.filter(pk__in=pks))
+
+        rendered += len(chunk)
+        last = chunk[-1].pk
+
+    if rendered:
+        # The detail ETags include the version, not the rendered body
+        bump_version('detail')
+
+    logger.info('Rendered the body of %d posts', rendered)
+    return rendered
+
+
+@shared_task
+def invalidate_posts_cache(slugs):
+    '''
+    Clears the archive cache of the given posts
+    '''
+    count = 0
+    version = get_version('api')
+    for post in Post._base_manager.filter(pk__in=slugs).iterator():
+        cache_handler(Post, instance=post)
+        default_cache.delete_many([
+            payload_cache_key(post, lang, version) for lang, name in settings.LANGUAGES
+        ])
+        count += 1
+
+    logger.info('Invalidated the cache of %d posts', count)
+    return count
+
+
+@shared_task
+def process_released_posts():
+    '''
+    Updates the post counts of the tags and categories and the related
+    posts of the posts whose embargo expired since the last run, and
+    regenerates the feed if there are any. Scheduled every few minutes from
+    Celery beat, see CELERY_BEAT_SCHEDULE in the README.
+    '''
+    now = timezone.now()
+
+    with transaction.atomic():
+        run = TaskRun.objects.select_for_update().filter(name='process_released_posts').first()
+
+        if run is None:
+            # First run, everything is recomputed
+            TagPostCount.update()
+            CategoryPostCount.update()
+            released = True
+        else:
+            posts = Post._base_manager.filter(published=True, release_date__gt=run.last_run, release_date__lte=now)
+            released = posts.exists()
+            if released:
+                TagPostCount.update(
+                    list(posts.values_list('tags', flat=True)) + list(posts.values_list('source__tags', flat=True)))
+                CategoryPostCount.update(posts.values_list('category', flat=True))
+                run_task(update_related_posts, list(posts.values_list('pk', flat=True)))
+                bump_version('search')
+
+        TaskRun.objects.update_or_create(name='process_released_posts', defaults={'last_run': now})
+
+    if released:
+        generate_feed()
+
+
+@shared_task
+def generate_feed():
+    '''
+    Writes the static version of the default feed
+    '''
+    size = generate_static_feed()
+    logger.info('Generated the blog feed (%d bytes)', size)
+
+
+@shared_task
+def update_post_enclosures(slugs=None):
+    '''
+    Stores the URL, size and MIME type of the banner resource of the given
+    posts (all of them if None) for the feed enclosures
+    '''
+    qs = Post.objects.select_related('banner')
+    if slugs is not None:
+        qs = qs.filter(pk__in=slugs)
+
+    count = 0
+    for post in qs.iterator():
+        resource = getattr(post.banner, 'resource_screen', None) if post.banner_id else None
+        if not resource:
+            PostEnclosure.objects.filter(post=post).delete()
+            continue
+
+        try:
+            length = resource.size
+        except (IOError, OSError) as e:
+            logger.warning('Could not read banner of post %s: %s', post.pk, e)
+            continue
+        finally:
+            if not resource.closed:
+                resource.close()
+
+        PostEnclosure.objects.update_or_create(post=post, defaults={
+            'url': resource.absolute_url,
+            'length': length,
+            'mime_type': mimetypes.guess_type(resource.name)[0] or 'image/jpeg',
+        })
+        count += 1
+
+    return count
+
+
+@shared_task
+def update_search_index(slugs=None, chunk_size=500):
+    '''
+    (Re)indexes the given posts and translations, all of them if None
+    '''
+    qs = Post._base_manager.order_by('pk')
+    if slugs is not None:
+        qs = qs.filter(pk__in=slugs)
+
+    count = 0
+    last = None
+    while True:
+        chunk = list((qs.filter(pk__gt=last) if last is not None else qs)[:chunk_size])
+        if not chunk:
+            break
+        index_posts(chunk)
+        count += len(chunk)
+        last = chunk[-1].pk
+
+    bump_version('search')
+    logger.info('Indexed %d posts', count)
+    return count
+
+
+@shared_task
+def update_related_posts(slugs=None):
+    '''
+    Recomputes the related posts of the given posts and of the posts they
+    are related to, of all posts if None
+    '''
+    if slugs is None:
+        return related.rebuild()
+    return related.update(slugs)
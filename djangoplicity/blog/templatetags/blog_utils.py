@@ -1,6 +1,6 @@
 from django import template
 from django.utils.html import format_html
-from djangoplicity.blog.models import Category
+from djangoplicity.blog.models import Category, CategoryPostCount
 from random import randint
 
 register = template.Library()
@@ -8,8 +8,13 @@ register = template.Library()
 
 @register.inclusion_tag('blog/categories_list.html')
 def list_blog_categories():
+    categories = list(Category.objects.all())
+    counts = CategoryPostCount.counts()
+    for category in categories:
+        category.post_count = counts.get(category.pk, 0)
+
     return {
-        "categories": Category.objects.all()
+        "categories": categories
     }
 
 
@@ -34,9 +34,21 @@ from django.conf.urls import url, include
 from djangoplicity.archives.urls import urlpatterns_for_options
 
 from djangoplicity.blog.options import PostOptions
+from djangoplicity.blog.sitemaps import sitemap_index, sitemap_section
+from djangoplicity.blog.views import conditional_post_list
+
+# Public list views answered with a 304 when no post changed, the
+# staging query is left out as embargoed posts are only shown to staff
+CONDITIONAL_URLNAMES = ('blog_defaultquery', 'blog_query_tag', 'blog_query_category')
 
 urlpatterns = urlpatterns_for_options(PostOptions)
 
+for pattern in urlpatterns:
+    if getattr(pattern, 'name', None) in CONDITIONAL_URLNAMES:
+        pattern.callback = conditional_post_list('list')(pattern.callback)
+
 urlpatterns += [
+    url(r'^sitemap\.xml$', sitemap_index, name='blog_sitemap'),
+    url(r'^sitemap-(?P<section>[\w-]+)-(?P<page>\d+)\.xml$', sitemap_section, name='blog_sitemap_section'),
     url(r'^api/', include('djangoplicity.blog.api.urls')),
 ]
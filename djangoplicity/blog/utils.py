@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+#
+# eso-blog
+# Copyright (c) 2007-2017, European Southern Observatory (ESO)
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#
+#   * Neither the name of the European Southern Observatory nor the names
+#     of its contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY ESO ``AS IS'' AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL ESO BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER
+# IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE
+
+from __future__ import unicode_literals
+
+import threading
+
+from django.contrib.sites.models import Site
+from django.core.urlresolvers import reverse
+from django.db.models import signals
+
+from djangoplicity.translation.models import translation_reverse
+
+
+class PostURLBuilder(object):
+    '''
+    Builds the URLs of posts and translations. The URL patterns are reversed
+    once per language and the site domain is looked up once per process
+    (until a Site is saved) instead of once per post.
+    '''
+    placeholder = 'blogslugplaceholder'
+
+    def __init__(self):
+        self._patterns = {}
+        self._domain = None
+        self._lock = threading.Lock()
+
+    def clear(self, *args, **kwargs):
+        with self._lock:
+            self._patterns = {}
+            self._domain = None
+
+    @property
+    def domain(self):
+        if self._domain is None:
+            self._domain = Site.objects.get_current().domain
+        return self._domain
+
+    def reverse(self, urlname, slug, lang=None):
+        '''
+        Returns the path of the given URL name for the slug in the given
+        language (the default one if None)
+        '''
+        pattern = self._patterns.get((urlname, lang))
+        if pattern is None:
+            if lang is None:
+                pattern = reverse(urlname, args=[self.placeholder])
+            else:
+                pattern = translation_reverse(urlname, args=[self.placeholder], lang=lang)
+            with self._lock:
+                self._patterns[(urlname, lang)] = pattern
+
+        return pattern.replace(self.placeholder, slug)
+
+    def path(self, post):
+        '''
+        Returns the path of the post, translations use the slug of their
+        source which is known without fetching it
+        '''
+        return self.reverse('blog_detail', post.source_id or post.pk, post.lang)
+
+    def absolute(self, path):
+        return 'https://{}{}'.format(self.domain, path)
+
+    def absolute_url(self, post):
+        return self.absolute(self.path(post))
+
+
+url_builder = PostURLBuilder()
+
+
+signals.post_save.connect(url_builder.clear, sender=Site)
+signals.post_delete.connect(url_builder.clear, sender=Site)
@@ -1,14 +1,76 @@
+import copy
+import hashlib
+
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
-from django.template import engines, TemplateSyntaxError
+from django.template import Engine, Template, TemplateSyntaxError
 
+from djangoplicity.blog.cache import LRUCache, default_cache
+
+TEMPLATE_CHECK_CACHE_SIZE = getattr(settings, 'BLOG_TEMPLATE_CHECK_CACHE_SIZE', 1024)
+# The results are also shared between processes through the default cache,
+# the timeout bounds how long they outlive changes to the template tags
+TEMPLATE_CHECK_CACHE_TIMEOUT = getattr(settings, 'BLOG_TEMPLATE_CHECK_CACHE_TIMEOUT', 60 * 60)
+
+# Results of check_template, keyed on the hash of the template string
+checked_templates = LRUCache(TEMPLATE_CHECK_CACHE_SIZE)
+
+_debug_engine = None
+
+
+def get_debug_engine():
+    '''
+    In production the template Engine has debug set to False, but as we need
+    it to locate the errors we use a copy with debug set to True
+    '''
+    global _debug_engine
+    if _debug_engine is None:
+        engine = copy.copy(Engine.get_default())
+        engine.debug = True
+        _debug_engine = engine
+    return _debug_engine
+
+
+def check_template(value):
+    '''
+    Parses the template string without rendering it, returns None if it is
+    valid or a dict with the message, line and token of the error
+    '''
+    key = hashlib.sha1(value.encode('utf-8')).hexdigest()
+    result = checked_templates.get(key, False)
+    if result is not False:
+        return result
+
+    # Valid templates are stored as {} as None means missing
+    result = default_cache.get('blog_template_check_%s' % key)
+    if result is not None:
+        result = result or None
+        checked_templates.set(key, result)
+        return result
 
-def validate_string_template(value):
     try:
-        tpl = engines['django'].from_string(value)
-        tpl.render()
+        Template(value, engine=get_debug_engine())
+        result = None
     except TemplateSyntaxError as e:
+        debug = getattr(e, 'template_debug', None) or {}
+        result = {
+            'message': '%s' % e,
+            'line': debug.get('line'),
+            'token': debug.get('during'),
+            'before': debug.get('before', ''),
+            'after': debug.get('after', ''),
+        }
+
+    checked_templates.set(key, result)
+    default_cache.set('blog_template_check_%s' % key, result or {}, TEMPLATE_CHECK_CACHE_TIMEOUT)
+    return result
+
+
+def validate_string_template(value):
+    error = check_template(value)
+    if error is not None:
         raise ValidationError(
-            _('%(value)s is not a valid string format'),
-            params={'value': e.message},
+            _('%(value)s is not a valid string format (line %(line)s: %(token)s)'),
+            params={'value': error['message'], 'line': error['line'], 'token': error['token']},
         )
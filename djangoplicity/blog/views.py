@@ -31,18 +31,144 @@
 
 from __future__ import unicode_literals
 
-from django.template import engines
+from calendar import timegm
+from datetime import datetime
+import hashlib
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import condition
 
 from djangoplicity.archives.views import GenericDetailView
 
+from djangoplicity.blog.cache import get_version, render_body
+from djangoplicity.blog.models import public_posts
+
+
+def _user_key(request):
+    '''
+    Pages contain edit links for logged in users, so they get their own
+    validators
+    '''
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user.pk
+    return ''
+
+
+def _make_etag(*parts):
+    value = '|'.join('%s' % part for part in parts)
+    return hashlib.md5(value.encode('utf-8')).hexdigest()
+
+
+def _latest(*dates):
+    dates = [d for d in dates if d is not None]
+    return max(dates) if dates else None
+
+
+def _version_date(name):
+    date = datetime.utcfromtimestamp(get_version(name)).replace(tzinfo=timezone.utc)
+    return date if settings.USE_TZ else timezone.make_naive(date)
+
+
+def _list_state(request):
+    '''
+    Aggregate over the public posts, computed once per request. The count
+    and latest release date change when a post is deleted or leaves embargo.
+    '''
+    state = getattr(request, '_blog_list_state', None)
+    if state is None:
+        state = public_posts().aggregate(
+            last_modified=Max('last_modified'),
+            release_date=Max('release_date'),
+            count=Count('pk'),
+        )
+        request._blog_list_state = state
+    return state
+
+
+def accepts_gzip(request):
+    return 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+
+
+def conditional_post_list(surface, vary_encoding=False):
+    '''
+    Returns a decorator answering conditional GETs for views listing the
+    public posts, invalidated by changes to the given surface. If
+    vary_encoding is True the view can answer with a gzipped body, which
+    gets its own ETag.
+    '''
+    def etag_func(request, *args, **kwargs):
+        state = _list_state(request)
+        return _make_etag(
+            surface, state['last_modified'], state['release_date'], state['count'],
+            get_version(surface), getattr(request, 'LANGUAGE_CODE', ''),
+            _user_key(request), vary_encoding and accepts_gzip(request)
+        )
+
+    def last_modified_func(request, *args, **kwargs):
+        if _user_key(request):
+            return None
+        state = _list_state(request)
+        return _latest(state['last_modified'], state['release_date'], _version_date(surface))
+
+    decorator = condition(etag_func=etag_func, last_modified_func=last_modified_func)
+    if not vary_encoding:
+        return decorator
+
+    def vary_decorator(view):
+        conditional_view = decorator(view)
+
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            patch_vary_headers(response, ('Accept-Encoding', ))
+            return response
+        return wrapper
+
+    return vary_decorator
+
 
 class PostDetailView(GenericDetailView):
     def render(self, request, model, obj, state, admin_rights, **kwargs):
         '''
         Override render to pre-render the post body as it can contain
-        template tags
+        template tags, the body is normally already rendered on save.
+        Public requests are answered with a 304 if neither the post nor the
+        tag and category counts and related posts shown beside it changed.
         '''
-        tpl = engines['django'].from_string(obj.body)
-        obj.body = tpl.render()
+        if admin_rights:
+            return self.render_post(request, model, obj, state, admin_rights, **kwargs)
+
+        etag = quote_etag(_make_etag(
+            obj.pk, obj.lang, obj.last_modified, get_version('detail'),
+            get_version('counts'), get_version('related'),
+            getattr(request, 'LANGUAGE_CODE', ''), _user_key(request)
+        ))
+        last_modified = None
+        if not _user_key(request):
+            last_modified = _latest(
+                obj.last_modified, _version_date('detail'), _version_date('counts'),
+                _version_date('related'))
+        if last_modified is not None:
+            last_modified = timegm(last_modified.utctimetuple())
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is not None:
+            return response
+
+        response = self.render_post(request, model, obj, state, admin_rights, **kwargs)
+        if response.status_code == 200:
+            if not response.has_header('ETag'):
+                response['ETag'] = etag
+            if last_modified is not None and not response.has_header('Last-Modified'):
+                response['Last-Modified'] = http_date(last_modified)
+
+        return response
+
+    def render_post(self, request, model, obj, state, admin_rights, **kwargs):
+        obj.body = obj.rendered_body or render_body(obj)
 
         return super(PostDetailView, self).render(request, model, obj, state, admin_rights, **kwargs)
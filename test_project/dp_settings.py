@@ -5,3 +5,4 @@ CELERY_ALWAYS_EAGER = True
 CELERY_TASK_EAGER_PROPOGATES=True
 CELERY_RESULT_BACKEND = 'db+sqlite:///results.db'
 CELERY_BROKER_URL = 'memory://localhost//'
+BLOG_ASYNC_TASKS = False
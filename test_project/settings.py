@@ -248,6 +248,7 @@ ADV_SEARCH_START_YEAR = 1998
 CELERY_IMPORTS = [
     "djangoplicity.archives.contrib.security.tasks",
     "djangoplicity.celery.tasks",
+    "djangoplicity.blog.tasks",
 ]
 # Task result backend
 CELERY_RESULT_BACKEND = "amqp"
@@ -265,4 +266,14 @@ CELERY_RESULT_EXPIRES = 3600
 # File to save revoked tasks across workers restart
 CELERY_WORKER_STATE_DB = os.path.join(TMP_DIR, 'celery_states')
 CELERY_BEAT_SCHEDULE_FILENAME = os.path.join(TMP_DIR, 'celerybeat_schedule')
+CELERY_BEAT_SCHEDULE = {
+    # Updates the feed and post counts when embargoes expire
+    'blog-process-released-posts': {
+        'task': 'djangoplicity.blog.tasks.process_released_posts',
+        'schedule': 5 * 60,
+    },
+}
+
 
+# Run the blog tasks right away, transactions are never committed in tests
+BLOG_ASYNC_TASKS = False
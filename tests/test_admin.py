@@ -0,0 +1,111 @@
+from importlib import import_module
+from unittest import skipUnless
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import RequestFactory, TransactionTestCase
+
+from djangoplicity.blog.admin import AuthorPrefixFilter, PostAdmin, TagPrefixFilter
+from djangoplicity.blog.models import Author, Post, Tag
+
+from tests.utils import BlogTestCase
+
+prefix_indexes = import_module('djangoplicity.blog.migrations.0016_prefix_indexes')
+
+
+class HighVolumePostAdmin(PostAdmin):
+    # The filters used when BLOG_ADMIN_HIGH_VOLUME is True
+    list_filter = ('category', AuthorPrefixFilter, TagPrefixFilter)
+
+
+class PrefixFilterTests(BlogTestCase):
+    '''
+    The author and tag filters of the changelist match the beginning of
+    the names typed in, case insensitively
+    '''
+    def setUp(self):
+        super(PrefixFilterTests, self).setUp()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        alice = Author.objects.create(name='Alice')
+        bob = Author.objects.create(name='Bob')
+        solar = Tag.objects.create(name='Solar system', slug='solar-system')
+        deep = Tag.objects.create(name='Deep sky', slug='deep-sky')
+        self.create_posts(
+            [self.post('comet'), self.post('galaxy'), self.post('nebula')],
+            tags={'comet': [solar], 'galaxy': [deep], 'nebula': [deep]},
+            authors={'comet': [alice], 'galaxy': [bob], 'nebula': [alice, bob]},
+        )
+
+    def changelist(self, **params):
+        request = RequestFactory().get('/admin/blog/post/', params)
+        request.user = self.admin
+        response = HighVolumePostAdmin(Post, admin.site).changelist_view(request)
+        return response.render()
+
+    def slugs(self, **params):
+        return sorted(post.pk for post in self.changelist(**params).context_data['cl'].result_list)
+
+    def test_unfiltered(self):
+        self.assertEqual(self.slugs(), ['comet', 'galaxy', 'nebula'])
+
+    def test_author(self):
+        self.assertEqual(self.slugs(author='ali'), ['comet', 'nebula'])
+        self.assertEqual(self.slugs(author='Zed'), [])
+
+    def test_tag(self):
+        self.assertEqual(self.slugs(tag='DEEP'), ['galaxy', 'nebula'])
+
+    def test_combined(self):
+        self.assertEqual(self.slugs(author='ali', tag='deep'), ['nebula'])
+
+    def test_rendered(self):
+        content = self.changelist(author='ali').content.decode('utf-8')
+
+        self.assertIn('<input type="text" name="author" value="ali"', content)
+        # The other filters keep the typed prefix
+        self.assertIn('<input type="hidden" name="author" value="ali">', content)
+
+
+class PrefixIndexTests(TransactionTestCase):
+    '''
+    Migration 0016 creates the indexes used by the istartswith lookups of
+    the prefix filters and autocompletion, the schema editor can't be used
+    in a transaction on SQLite
+    '''
+    names = set(name for name, table, column in prefix_indexes.PREFIX_INDEXES)
+
+    def indexes(self):
+        names = set()
+        with connection.cursor() as cursor:
+            for table in set(table for name, table, column in prefix_indexes.PREFIX_INDEXES):
+                names.update(connection.introspection.get_constraints(cursor, table))
+        return names
+
+    def test_create_drop(self):
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            self.skipTest('No prefix indexes on %s' % connection.vendor)
+
+        self.assertTrue(self.names <= self.indexes())
+
+        with connection.schema_editor() as schema_editor:
+            prefix_indexes.drop_prefix_indexes(None, schema_editor)
+        self.assertFalse(self.names & self.indexes())
+
+        with connection.schema_editor() as schema_editor:
+            prefix_indexes.create_prefix_indexes(None, schema_editor)
+        self.assertTrue(self.names <= self.indexes())
+
+    @skipUnless(connection.vendor == 'postgresql', 'Expression indexes')
+    def test_postgresql_plan(self):
+        sql, params = Tag.objects.filter(name__istartswith='deep').values('pk').query.sql_with_params()
+        with connection.cursor() as cursor:
+            # The tables are too small for the planner to prefer an index
+            cursor.execute('SET enable_seqscan = off')
+            try:
+                cursor.execute('EXPLAIN ' + sql, params)
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+            finally:
+                cursor.execute('RESET enable_seqscan')
+
+        self.assertIn('blog_tag_name_prefix', plan)
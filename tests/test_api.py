@@ -0,0 +1,90 @@
+from datetime import timedelta
+
+from django.db import connection
+
+from djangoplicity.blog.models import Category, Post, Tag
+from djangoplicity.blog.search import get_backend, index_posts
+
+from tests.utils import BlogTestCase
+
+
+class PostListTests(BlogTestCase):
+    url = '/public/blog/api/posts/'
+
+    def setUp(self):
+        super(PostListTests, self).setUp()
+        self.events = Category.objects.create(name='Events', slug='events')
+        self.tag = Tag.objects.create(name='Telescopes', slug='telescopes')
+        self.create_posts([
+            self.post('post-0', days=1),
+            self.post('post-1', release_date=None),
+            self.post('post-2', days=2, category=self.events),
+            self.post('post-0-de', lang='de', source_id='post-0', days=1),
+        ], tags={'post-0': [self.tag]})
+
+    def slugs(self, **params):
+        slugs = []
+        response = self.client.get(self.url, dict(params, page_size=1))
+        while True:
+            self.assertEqual(response.status_code, 200)
+            slugs.extend(post['slug'] for post in response.data['results'])
+            if not response.data['next']:
+                return slugs
+            response = self.client.get(response.data['next'])
+
+    def test_pages(self):
+        # Posts without release date can't be paginated on it
+        self.assertEqual(self.slugs(), ['post-0', 'post-2'])
+
+    def test_category(self):
+        self.assertEqual(self.slugs(category='events'), ['post-2'])
+
+    def test_tag(self):
+        self.assertEqual(self.slugs(tag='telescopes'), ['post-0'])
+        self.assertEqual(self.slugs(tag='telescopes', lang='de'), ['post-0-de'])
+
+    def test_lang(self):
+        self.assertEqual(self.slugs(lang='de'), ['post-0-de'])
+
+    def test_updated_since(self):
+        since = self.now + timedelta(hours=1)
+        Post._base_manager.filter(pk='post-2').update(last_modified=since + timedelta(minutes=1))
+
+        self.assertEqual(self.slugs(updated_since=since.isoformat()), ['post-2'])
+        self.assertEqual(self.client.get(self.url, {'updated_since': 'yesterday'}).status_code, 400)
+
+
+class PostSearchTests(BlogTestCase):
+    url = '/public/blog/api/search/'
+
+    def setUp(self):
+        super(PostSearchTests, self).setUp()
+        if get_backend() is None:
+            self.skipTest('No full-text search on %s' % connection.vendor)
+
+        index_posts(self.create_posts([
+            self.post('new-telescope', 'New telescope'),
+            self.post('telescope-mirror', 'Telescope mirror', days=2),
+        ]))
+
+    def slugs(self):
+        response = self.client.get(self.url, {'q': 'telescope'})
+        self.assertEqual(response.status_code, 200)
+        return [post['slug'] for post in response.data['results']]
+
+    def test_unpublished_removed(self):
+        self.assertEqual(self.slugs(), ['new-telescope', 'telescope-mirror'])
+
+        post = Post._base_manager.get(pk='telescope-mirror')
+        post.published = False
+        post.save()
+
+        self.assertEqual(self.slugs(), ['new-telescope'])
+
+    def test_cached_hits_filtered(self):
+        self.assertEqual(self.slugs(), ['new-telescope', 'telescope-mirror'])
+
+        # Not sent to the handlers, the cached hits still have the post
+        Post._base_manager.filter(pk='telescope-mirror').update(release_date=self.now + timedelta(days=1))
+
+        self.assertEqual(self.slugs(), ['new-telescope'])
@@ -0,0 +1,36 @@
+from django.test import SimpleTestCase
+
+from djangoplicity.blog.cache import LRUCache, payload_cache_key
+from djangoplicity.blog.models import Post
+
+
+class TestLRUCache(SimpleTestCase):
+    def test_eviction(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        # Access 'a' so that 'b' becomes the least recently used
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(len(cache), 2)
+
+    def test_stats(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.get('a')
+        cache.get('missing')
+
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1, 'size': 1, 'maxsize': 2})
+
+        cache.clear()
+        self.assertEqual(cache.stats(), {'hits': 0, 'misses': 0, 'size': 0, 'maxsize': 2})
+
+
+class TestPayloadCacheKey(SimpleTestCase):
+    def test_explicit_version(self):
+        post = Post(slug='post', lang='en')
+        self.assertEqual(payload_cache_key(post, 'de', 42), 'blog_api_post_post_en_de__42')
@@ -0,0 +1,93 @@
+from django.core.urlresolvers import reverse
+from django.test import RequestFactory
+
+from djangoplicity.blog import related
+from djangoplicity.blog.cache import bump_version
+from djangoplicity.blog.feeds import PostFeed
+from djangoplicity.blog.models import Tag, TagPostCount
+
+from tests.utils import BlogTestCase
+
+
+class ConditionalGetTests(BlogTestCase):
+    '''
+    Public pages answer conditional requests with a 304 until the posts
+    or the versions of the cached surfaces change
+    '''
+    def setUp(self):
+        super(ConditionalGetTests, self).setUp()
+        self.tag = Tag.objects.create(name='Telescopes', slug='telescopes')
+        self.first = self.create_posts([self.post('first-light')], tags={'first-light': [self.tag]})[0]
+
+    def urls(self):
+        return [
+            reverse('blog_detail', args=[self.first.slug]),
+            reverse('blog_defaultquery'),
+            reverse('blog_query_tag', args=[self.tag.slug]),
+            reverse('blog_query_category', args=[self.category.slug]),
+        ]
+
+    def feed(self, **headers):
+        return PostFeed()(RequestFactory().get('/public/blog/feed/', **headers))
+
+    def test_if_none_match(self):
+        for url in self.urls():
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304, url)
+
+        response = self.feed()
+        self.assertEqual(self.feed(HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_if_modified_since(self):
+        for url in self.urls():
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+            self.assertEqual(response.status_code, 304, url)
+
+        response = self.feed()
+        self.assertEqual(self.feed(HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+    def test_save_changes_validators(self):
+        etags = [self.client.get(url)['ETag'] for url in self.urls()]
+        feed_etag = self.feed()['ETag']
+
+        self.first.title = 'First light at last'
+        self.first.save()
+
+        for url, etag in zip(self.urls(), etags):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertNotEqual(response['ETag'], etag, url)
+        self.assertEqual(self.feed(HTTP_IF_NONE_MATCH=feed_etag).status_code, 200)
+
+    def test_version_bump_changes_validators(self):
+        detail, listing = self.urls()[:2]
+        detail_etag = self.client.get(detail)['ETag']
+        list_etag = self.client.get(listing)['ETag']
+
+        bump_version('detail')
+        self.assertEqual(self.client.get(detail, HTTP_IF_NONE_MATCH=detail_etag).status_code, 200)
+        # Other surfaces are not affected
+        self.assertEqual(self.client.get(listing, HTTP_IF_NONE_MATCH=list_etag).status_code, 304)
+
+        bump_version('list')
+        self.assertEqual(self.client.get(listing, HTTP_IF_NONE_MATCH=list_etag).status_code, 200)
+
+    def test_counts_change_detail_validators(self):
+        detail = self.urls()[0]
+        etag = self.client.get(detail)['ETag']
+
+        TagPostCount.update([self.tag.pk])
+        self.assertEqual(self.client.get(detail, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_related_posts_change_detail_validators(self):
+        detail = self.urls()[0]
+        etag = self.client.get(detail)['ETag']
+
+        related.rebuild()
+        self.assertEqual(self.client.get(detail, HTTP_IF_NONE_MATCH=etag).status_code, 200)
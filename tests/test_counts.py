@@ -0,0 +1,38 @@
+from djangoplicity.blog.models import CategoryPostCount, Tag, TagPostCount
+
+from tests.utils import BlogTestCase
+
+
+class PostCountTests(BlogTestCase):
+    def setUp(self):
+        super(PostCountTests, self).setUp()
+        self.tag = Tag.objects.create(name='Telescopes', slug='telescopes')
+        self.create_posts([
+            self.post('first-light'),
+            self.post('second-light'),
+            self.post('first-light-de', lang='de', source_id='first-light'),
+            self.post('draft', published=False),
+            self.post('draft-de', lang='de', source_id='draft', published=False),
+        ], tags={'first-light': [self.tag], 'second-light': [self.tag], 'draft': [self.tag]})
+
+    def test_translations_are_counted_in_the_tags_of_their_source(self):
+        TagPostCount.update()
+
+        self.assertEqual(TagPostCount.counts('en'), {self.tag.pk: 2})
+        self.assertEqual(TagPostCount.counts('de'), {self.tag.pk: 1})
+        self.assertEqual(TagPostCount.objects.get(tag=self.tag, lang='de').count, 1)
+
+    def test_update_given_tags(self):
+        other = Tag.objects.create(name='Galaxies', slug='galaxies')
+        TagPostCount.update([self.tag.pk, other.pk])
+
+        self.assertEqual(
+            sorted(TagPostCount.objects.values_list('tag__slug', 'lang', 'count')),
+            [('telescopes', 'de', 1), ('telescopes', 'en', 2)]
+        )
+
+    def test_categories(self):
+        CategoryPostCount.update()
+
+        self.assertEqual(CategoryPostCount.counts('de'), {self.category.pk: 1})
+        self.assertEqual(CategoryPostCount.counts('en'), {self.category.pk: 2})
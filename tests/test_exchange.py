@@ -0,0 +1,158 @@
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.utils import timezone
+
+from djangoplicity.blog.exchange import ArchiveImporter, export_records, gzip_stream, read_records, \
+    to_ndjson
+from djangoplicity.blog.models import Author, AuthorDescription, Category, Post, Tag
+
+from tests.utils import BlogTestCase
+
+
+class ExchangeTests(BlogTestCase):
+    '''
+    An export imported into an empty archive gives back the same posts,
+    translations, tags and authors, the ones already in an archive are
+    matched by slug or name
+    '''
+    def setUp(self):
+        super(ExchangeTests, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        tags = Tag.objects.bulk_create([Tag(name='Tag %d' % i, slug='tag-%d' % i) for i in range(3)])
+        authors = Author.objects.bulk_create([Author(name='Author %d' % i) for i in range(2)])
+
+        posts = [self.post('post-%d' % i, body='<p>Body %d</p>' % i, days=i) for i in range(3)]
+        translation = self.post('post-0-de', 'Beitrag 0', lang='de', source_id='post-0', days=0)
+        self.create_posts(
+            posts + [translation],
+            tags=dict((post.slug, tags[:2]) for post in posts),
+            authors=dict((post.slug, authors) for post in posts),
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def snapshot(self):
+        return {
+            'posts': sorted(Post._base_manager.values_list('slug', 'lang', 'source', 'title', 'body', 'category__slug')),
+            'tags': sorted(Post.tags.through.objects.values_list('post', 'tag__slug')),
+            'authors': sorted(AuthorDescription.objects.values_list('post', 'author__name', 'description')),
+            'categories': sorted(Category.objects.values_list('slug', flat=True)),
+        }
+
+    def write(self, records, name):
+        path = os.path.join(self.directory, name)
+        stream = to_ndjson(records)
+        if name.endswith('.gz'):
+            stream = gzip_stream(stream)
+        with open(path, 'wb') as f:
+            for chunk in stream:
+                f.write(chunk)
+        return path
+
+    def clear(self):
+        Post._base_manager.filter(source__isnull=False).delete()
+        Post._base_manager.all().delete()
+        for model in (Tag, Category, Author):
+            model.objects.all().delete()
+
+    def load(self, records):
+        importer = ArchiveImporter(batch_size=2)
+        for record in records:
+            importer.add(record)
+        importer.finish()
+        return importer
+
+    def test_round_trip(self):
+        expected = self.snapshot()
+        path = self.write(export_records(chunk_size=2), 'blog.ndjson')
+
+        self.clear()
+        importer = self.load(read_records(path))
+
+        self.assertEqual(self.snapshot(), expected)
+        self.assertEqual(importer.created, {'category': 1, 'tag': 3, 'author': 2, 'post': 4})
+        # The bodies are rendered once the import is finished
+        self.assertIn('Body 0', Post._base_manager.get(pk='post-0').rendered_body)
+
+    def test_round_trip_gzip(self):
+        expected = self.snapshot()
+        path = self.write(export_records(), 'blog.ndjson.gz')
+
+        self.clear()
+        self.load(read_records(path))
+
+        self.assertEqual(self.snapshot(), expected)
+
+    def test_translation_before_source(self):
+        expected = self.snapshot()
+        records = list(export_records())
+
+        self.clear()
+        # The translations are kept until their source is imported
+        self.load(sorted(records, key=lambda r: r['type'] == 'post' and not r.get('source_id')))
+
+        self.assertEqual(self.snapshot(), expected)
+
+    def test_import_is_idempotent(self):
+        records = list(export_records())
+        importer = self.load(records)
+
+        self.assertEqual(importer.created, {'category': 0, 'tag': 0, 'author': 0, 'post': 0})
+        self.assertEqual(importer.skipped, len(records))
+
+    def test_after_slug(self):
+        records = list(export_records(after_slug='post-0-de', chunk_size=1))
+
+        self.assertEqual([r['type'] for r in records], ['post', 'post'])
+        self.assertEqual([r['slug'] for r in records], ['post-1', 'post-2'])
+
+    def test_since(self):
+        since = timezone.now() + timedelta(hours=1)
+        Post._base_manager.filter(pk='post-1').update(last_modified=since)
+
+        records = list(export_records(since=since))
+
+        self.assertEqual([r['slug'] for r in records if r['type'] == 'post'], ['post-1'])
+        self.assertEqual(len([r for r in records if r['type'] != 'post']), 6)
+
+    def test_resumed_export_round_trip(self):
+        expected = self.snapshot()
+        first = [r for r in export_records() if r['type'] != 'post' or r['slug'] <= 'post-0-de']
+        rest = list(export_records(after_slug=first[-1]['slug']))
+
+        self.clear()
+        self.load(first + rest)
+
+        self.assertEqual(self.snapshot(), expected)
+
+    def test_sequences_reset(self):
+        records = list(export_records())
+        self.clear()
+        self.load(records)
+
+        # New objects don't collide with the imported ids
+        Category.objects.create(name='Events', slug='events')
+        Tag.objects.create(name='New tag', slug='new-tag')
+        Author.objects.create(name='New author')
+
+    def test_existing_objects_matched(self):
+        expected = self.snapshot()
+        records = list(export_records())
+
+        self.clear()
+        # Created in another order, so that the ids differ from the export
+        Author.objects.create(name='Author 1')
+        Tag.objects.create(name='Other', slug='other')
+        Tag.objects.create(name='Tag 1', slug='tag-1')
+        Category.objects.create(name='Events', slug='events')
+        Category.objects.create(name='News', slug='news')
+        importer = self.load(records)
+
+        self.assertEqual(importer.created, {'category': 0, 'tag': 2, 'author': 1, 'post': 4})
+        self.assertEqual(self.snapshot(), dict(expected, categories=['events', 'news']))
+        self.assertEqual(Tag.objects.count(), 4)
+        self.assertEqual(Author.objects.count(), 2)
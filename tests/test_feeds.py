@@ -0,0 +1,57 @@
+import time
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.test import RequestFactory, override_settings
+from django.utils import timezone
+
+from djangoplicity.blog.feeds import PostFeed, generate_static_feed, static_feed_is_stale
+
+from tests.utils import BlogTestCase
+
+FEED_PATH = 'blog-tests/feed.xml'
+
+
+@override_settings(BLOG_STATIC_FEED=True, BLOG_FEED_PATH=FEED_PATH)
+class StaticFeedTests(BlogTestCase):
+    def setUp(self):
+        super(StaticFeedTests, self).setUp()
+        self.create_posts([self.post('first-light')])
+        generate_static_feed()
+
+    def tearDown(self):
+        for path in (FEED_PATH, FEED_PATH + '.gz'):
+            if default_storage.exists(path):
+                default_storage.delete(path)
+
+    def feed(self, **headers):
+        return PostFeed()(RequestFactory().get('/public/blog/feed/', **headers))
+
+    def test_encodings_have_their_own_etag(self):
+        plain = self.feed()
+        gzipped = self.feed(HTTP_ACCEPT_ENCODING='gzip, deflate')
+
+        self.assertEqual(gzipped['Content-Encoding'], 'gzip')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertNotEqual(plain['ETag'], gzipped['ETag'])
+        self.assertIn('Accept-Encoding', plain['Vary'])
+        self.assertIn('Accept-Encoding', gzipped['Vary'])
+
+        self.assertEqual(self.feed(HTTP_IF_NONE_MATCH=plain['ETag']).status_code, 304)
+        response = self.feed(HTTP_IF_NONE_MATCH=plain['ETag'], HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+
+    def test_served_without_stale_check_queries(self):
+        self.assertFalse(static_feed_is_stale())
+        # Only the aggregate of the conditional GET validators
+        with self.assertNumQueries(1):
+            self.feed()
+
+    def test_stale_once_an_embargo_expires(self):
+        release_date = timezone.now() + timedelta(seconds=1)
+        self.create_posts([self.post('embargoed', release_date=release_date)])
+        generate_static_feed()
+        self.assertFalse(static_feed_is_stale())
+
+        time.sleep(max((release_date - timezone.now()).total_seconds(), 0) + 0.1)
+        self.assertTrue(static_feed_is_stale())
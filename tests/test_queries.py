@@ -0,0 +1,133 @@
+import difflib
+import re
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from djangoplicity.blog.cache import body_templates
+from djangoplicity.blog.feeds import PostFeed
+from djangoplicity.blog.models import Author, Category, CategoryPostCount, Tag, TagPostCount
+
+from tests.utils import BlogTestCase
+
+
+def normalize(sql):
+    # Ignore the literal values so that only the shape of the queries differs
+    return re.sub(r"'[^']*'|\b\d+\b", '?', sql)
+
+
+class QueryBudgetTests(BlogTestCase):
+    '''
+    The number of queries of each page must not grow with the number of
+    posts, tags or authors, and must match its budget exactly so that a
+    change in either direction is noticed. Each page is requested with a
+    small and a large archive, on failure the queries of both are diffed.
+    '''
+    def setUp(self):
+        super(QueryBudgetTests, self).setUp()
+        self.count = 0
+        self.categories = [self.category] + Category.objects.bulk_create([
+            Category(name='Category %d' % i, slug='category-%d' % i) for i in range(1, 3)
+        ])
+        self.tags = Tag.objects.bulk_create([
+            Tag(name='Tag %d' % i, slug='tag-%d' % i) for i in range(40)
+        ])
+        self.authors = Author.objects.bulk_create([
+            Author(name='Author %d' % i) for i in range(10)
+        ])
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.seed(5)
+
+    def seed(self, count):
+        '''
+        Adds count posts, with several tags and authors and a translation
+        each
+        '''
+        posts = []
+        translations = []
+        for i in range(self.count, self.count + count):
+            category = self.categories[i % len(self.categories)]
+            posts.append(self.post('post-%d' % i, 'Post %d' % i, days=i, category=category))
+            translations.append(self.post(
+                'post-%d-de' % i, 'Beitrag %d' % i, days=i, category=category,
+                lang='de', source_id='post-%d' % i,
+            ))
+
+        self.create_posts(
+            posts + translations,
+            tags=dict(
+                (post.slug, [self.tags[(i + j) % len(self.tags)] for j in range(4)])
+                for i, post in enumerate(posts)
+            ),
+            authors=dict(
+                (post.slug, [self.authors[(i + j) % len(self.authors)] for j in range(2)])
+                for i, post in enumerate(posts)
+            ),
+        )
+
+        TagPostCount.update()
+        CategoryPostCount.update()
+        self.count += count
+
+    def capture(self, request):
+        cache.clear()
+        body_templates.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = request()
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in context.captured_queries]
+
+    def assertQueryBudget(self, budget, request):
+        small = self.capture(request)
+        self.seed(20)
+        large = self.capture(request)
+
+        diff = '\n'.join(difflib.unified_diff(
+            [normalize(sql) for sql in small], [normalize(sql) for sql in large],
+            'with %d posts' % (self.count - 20), 'with %d posts' % self.count, lineterm=''
+        ))
+        message = '%d then %d queries, budget is %d\n%s\n\nQueries with %d posts:\n%s' % (
+            len(small), len(large), budget, diff, self.count, '\n'.join(large))
+        self.assertEqual(len(small), len(large), message)
+        self.assertEqual(len(large), budget, message)
+
+    def get(self, url, **params):
+        return lambda: self.client.get(url, params)
+
+    def test_list(self):
+        self.assertQueryBudget(5, self.get(reverse('blog_defaultquery')))
+
+    def test_detail(self):
+        self.assertQueryBudget(9, self.get(reverse('blog_detail', args=['post-0'])))
+
+    def test_tag(self):
+        self.assertQueryBudget(6, self.get(reverse('blog_query_tag', args=['tag-0'])))
+
+    def test_category(self):
+        self.assertQueryBudget(6, self.get(reverse('blog_query_category', args=[self.category.slug])))
+
+    def test_staging(self):
+        self.client.force_login(self.admin)
+        self.assertQueryBudget(7, self.get(reverse('blog_query_staging')))
+
+    def test_feed(self):
+        request = RequestFactory().get('/public/blog/feed/')
+        self.assertQueryBudget(4, lambda: PostFeed().render(request))
+
+    def test_api_posts(self):
+        self.assertQueryBudget(3, self.get('/public/blog/api/posts/'))
+
+    def test_api_posts_translations(self):
+        self.assertQueryBudget(2, self.get('/public/blog/api/posts/', lang='de'))
+
+    def test_admin_post_changelist(self):
+        self.client.force_login(self.admin)
+        self.assertQueryBudget(8, self.get(reverse('admin:blog_post_changelist')))
+
+    def test_admin_translation_changelist(self):
+        self.client.force_login(self.admin)
+        self.assertQueryBudget(5, self.get(reverse('admin:blog_postproxy_changelist')))
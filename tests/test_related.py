@@ -0,0 +1,60 @@
+from django.db import connection
+
+from djangoplicity.blog import related
+from djangoplicity.blog.models import Post, RelatedFeature, RelatedPost, Tag, run_merged_task
+from djangoplicity.blog.tasks import update_related_posts
+
+from tests.utils import BlogTestCase
+
+
+class RelatedPostsTests(BlogTestCase):
+    def setUp(self):
+        super(RelatedPostsTests, self).setUp()
+        self.tags = Tag.objects.bulk_create([Tag(name='Tag %d' % i, slug='tag-%d' % i) for i in range(4)])
+        self.create([
+            ('telescope-mirror', 'Telescope mirror polished', [0, 1]),
+            ('telescope-dome', 'Telescope dome opened', [0, 1]),
+            ('galaxy-cluster', 'Galaxy cluster observed', [2, 3]),
+            ('galaxy-merger', 'Galaxy merger observed', [2, 3]),
+        ])
+        related.rebuild()
+
+    def create(self, posts):
+        self.create_posts(
+            [self.post(slug, title) for slug, title, tags in posts],
+            tags=dict((slug, [self.tags[i] for i in tags]) for slug, title, tags in posts),
+        )
+
+    def related(self, slug):
+        return list(RelatedPost.objects.filter(post=slug).order_by('-score').values_list('related', flat=True))
+
+    def test_rebuild(self):
+        self.assertEqual(self.related('telescope-mirror')[0], 'telescope-dome')
+        self.assertEqual(self.related('galaxy-cluster')[0], 'galaxy-merger')
+        self.assertTrue(RelatedFeature.objects.filter(post='telescope-mirror').exists())
+
+    def test_update_new_post(self):
+        self.create([('telescope-camera', 'Telescope camera installed', [0, 1])])
+        related.update(['telescope-camera'])
+
+        self.assertIn('telescope-mirror', self.related('telescope-camera')[:2])
+        # The similarity is symmetric
+        self.assertIn('telescope-camera', self.related('telescope-mirror'))
+        self.assertNotIn('telescope-camera', self.related('galaxy-cluster')[:1])
+
+    def test_update_unpublished_post(self):
+        Post._base_manager.filter(pk='telescope-dome').update(published=False)
+        related.update(['telescope-dome'])
+
+        self.assertEqual(self.related('telescope-dome'), [])
+        self.assertNotIn('telescope-dome', self.related('telescope-mirror'))
+        self.assertFalse(RelatedFeature.objects.filter(post='telescope-dome').exists())
+
+    def test_merged_task(self):
+        # Saving a post and its tags sends a single task once committed
+        run_merged_task(update_related_posts, ['telescope-dome'])
+        run_merged_task(update_related_posts, ['telescope-mirror', 'telescope-dome'])
+
+        callbacks = [func for sids, func in connection.run_on_commit if getattr(func, 'task', None)]
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(callbacks[0].slugs, {'telescope-dome', 'telescope-mirror'})
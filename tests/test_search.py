@@ -0,0 +1,128 @@
+from datetime import timedelta
+from importlib import import_module
+from unittest import skipUnless
+
+from django.contrib import admin
+from django.db import connection
+from django.test import RequestFactory, TransactionTestCase
+
+from djangoplicity.blog.admin import PostAdmin
+from djangoplicity.blog.models import Post
+from djangoplicity.blog.search import TABLE, get_backend, index_posts, search_posts, unindex_posts
+
+from tests.utils import BlogTestCase
+
+
+class SearchBackendTests(BlogTestCase):
+    '''
+    The posts are indexed, matched and ranked by the full-text backend of
+    the database, the title weighing over the lede and the body
+    '''
+    def setUp(self):
+        super(SearchBackendTests, self).setUp()
+        if get_backend() is None:
+            self.skipTest('No full-text search on %s' % connection.vendor)
+
+        self.posts = self.create_posts([
+            self.post('telescope', 'New telescope', lede='First light', body='<p>Dome</p>'),
+            self.post('mirror-polishing', 'Mirror polishing', lede='The telescope mirror', days=2),
+            self.post('galaxy', 'Distant galaxy', lede='Far away', body='<p>Seen with a telescope</p>', days=3),
+        ])
+        index_posts(self.posts)
+
+    def test_ranking(self):
+        self.assertEqual(search_posts('telescope'), ['telescope', 'mirror-polishing', 'galaxy'])
+
+    def test_stemming(self):
+        self.assertEqual(search_posts('galaxies'), ['galaxy'])
+        self.assertEqual(len(search_posts('telescopes')), 3)
+
+    def test_markup_not_indexed(self):
+        self.assertEqual(search_posts('p'), [])
+
+    def test_limit_offset(self):
+        self.assertEqual(search_posts('telescope', limit=1, offset=1), ['mirror-polishing'])
+
+    def test_lang(self):
+        translation = self.create_posts([
+            self.post('telescope-de', 'Neues Teleskop', lang='de', source_id='telescope', days=0)
+        ])
+        index_posts(translation)
+
+        self.assertEqual(search_posts('teleskop', lang='de'), ['telescope-de'])
+        self.assertEqual(search_posts('teleskop', lang='en'), [])
+        self.assertEqual(search_posts('telescope', lang='de'), ['telescope-de'])
+
+    def test_public(self):
+        Post._base_manager.filter(pk='galaxy').update(published=False)
+        Post._base_manager.filter(pk='mirror-polishing').update(release_date=self.now + timedelta(days=1))
+
+        self.assertEqual(search_posts('telescope', public=True), ['telescope'])
+        self.assertEqual(len(search_posts('telescope')), 3)
+
+    def test_reindexed_on_save(self):
+        post = Post._base_manager.get(pk='galaxy')
+        post.title = 'Distant nebula'
+        post.save()
+
+        self.assertEqual(search_posts('nebula'), ['galaxy'])
+        self.assertEqual(search_posts('galaxy'), [])
+
+    def test_deletion(self):
+        unindex_posts(['mirror-polishing'])
+        self.assertEqual(search_posts('telescope'), ['telescope', 'galaxy'])
+
+        Post._base_manager.get(pk='galaxy').delete()
+        self.assertEqual(search_posts('telescope'), ['telescope'])
+
+    def test_admin_search(self):
+        model_admin = PostAdmin(Post, admin.site)
+        request = RequestFactory().get('/admin/blog/post/', {'q': 'mirror'})
+
+        queryset, use_distinct = model_admin.get_search_results(request, Post._base_manager.all(), 'mirror')
+
+        # The index is queried instead of the search_fields
+        self.assertIn(TABLE, '%s' % queryset.query)
+        self.assertEqual(sorted(queryset.values_list('pk', flat=True)), ['mirror-polishing'])
+        self.assertFalse(use_distinct)
+
+        queryset, use_distinct = model_admin.get_search_results(request, Post._base_manager.all(), ' ')
+        self.assertEqual(queryset.count(), 3)
+
+    @skipUnless(connection.vendor == 'sqlite', 'FTS5 query syntax')
+    def test_sqlite_operators_searched_as_text(self):
+        self.assertEqual(search_posts('telescope OR galaxy'), [])
+        self.assertEqual(search_posts('"telescope'), ['telescope', 'mirror-polishing', 'galaxy'])
+
+    @skipUnless(connection.vendor == 'postgresql', 'Text search configurations')
+    def test_postgresql_language_config(self):
+        translation = self.create_posts([
+            self.post('telescope-de', 'Neue Teleskope', lang='de', source_id='telescope', days=0)
+        ])
+        index_posts(translation)
+
+        # Stemmed with the german configuration
+        self.assertEqual(search_posts('Teleskop', lang='de'), ['telescope-de'])
+
+
+class SearchMigrationTests(TransactionTestCase):
+    '''
+    Migration 0014 creates the table of the index for the database, the
+    schema editor can't be used in a transaction on SQLite
+    '''
+    def test_create_drop(self):
+        if get_backend() is None:
+            self.skipTest('No full-text search on %s' % connection.vendor)
+        migration = import_module('djangoplicity.blog.migrations.0014_post_search')
+
+        with connection.schema_editor() as schema_editor:
+            migration.drop_search_table(None, schema_editor)
+        self.assertNotIn(TABLE, connection.introspection.table_names())
+
+        with connection.schema_editor() as schema_editor:
+            migration.create_search_table(None, schema_editor)
+        self.assertIn(TABLE, connection.introspection.table_names())
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM ' + TABLE)
+            self.assertEqual(cursor.fetchone()[0], 0)
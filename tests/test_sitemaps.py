@@ -0,0 +1,87 @@
+from datetime import timedelta
+
+from django.core.urlresolvers import reverse
+from django.test import RequestFactory
+
+from djangoplicity.blog.models import CategoryPostCount, Post, Tag, TagPostCount
+from djangoplicity.blog.sitemaps import sitemap_section
+
+from tests.utils import BlogTestCase
+
+
+class SitemapTests(BlogTestCase):
+    '''
+    The sitemap index lists a chunk per section, the chunks are cached
+    until the posts or their counts change
+    '''
+    def setUp(self):
+        super(SitemapTests, self).setUp()
+        self.tag = Tag.objects.create(name='Telescopes', slug='telescopes')
+        Tag.objects.create(name='Unused', slug='unused')
+        self.create_posts([
+            self.post('first-light', days=2),
+            self.post('new-mirror', days=1),
+            self.post('first-light-de', 'Erstes Licht', lang='de', source_id='first-light', days=2),
+            self.post('draft', published=False),
+            self.post('embargoed', release_date=self.now + timedelta(days=1)),
+        ], tags={'first-light': [self.tag], 'new-mirror': [self.tag], 'embargoed': [self.tag]})
+        Post._base_manager.filter(pk='new-mirror').update(last_modified=self.now + timedelta(days=3))
+        TagPostCount.update()
+        CategoryPostCount.update()
+
+    def section(self, section, page=1):
+        response = self.client.get(reverse('blog_sitemap_section', kwargs={'section': section, 'page': page}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/xml')
+        return response.content.decode('utf-8')
+
+    def test_index(self):
+        response = self.client.get(reverse('blog_sitemap'))
+        content = response.content.decode('utf-8')
+
+        self.assertEqual(response.status_code, 200)
+        for section in ('posts-en', 'posts-de', 'tags', 'categories'):
+            self.assertIn('sitemap-%s-1.xml' % section, content)
+        self.assertEqual(content.count('<sitemap>'), 4)
+
+    def test_posts(self):
+        content = self.section('posts-en')
+
+        self.assertEqual(content.count('<url>'), 2)
+        self.assertNotIn('draft', content)
+        self.assertNotIn('embargoed', content)
+        # Alternates of the posts with translations only
+        self.assertEqual(content.count('hreflang="de"'), 1)
+        self.assertIn('<lastmod>%s</lastmod>' % (self.now + timedelta(days=3)).strftime('%Y-%m-%d'), content)
+
+        self.assertIn('hreflang="en"', self.section('posts-de'))
+
+    def test_tags_and_categories(self):
+        lastmod = '<lastmod>%s</lastmod>' % (self.now + timedelta(days=3)).strftime('%Y-%m-%d')
+
+        content = self.section('tags')
+        self.assertEqual(content.count('<url>'), 1)
+        self.assertIn('telescopes', content)
+        self.assertIn(lastmod, content)
+
+        content = self.section('categories')
+        self.assertEqual(content.count('<url>'), 1)
+        self.assertIn(self.category.slug, content)
+        self.assertIn(lastmod, content)
+
+    def test_not_found(self):
+        for section, page in (('posts-en', 2), ('posts-fr', 1), ('authors', 1), ('tags', 0)):
+            url = reverse('blog_sitemap_section', kwargs={'section': section, 'page': page})
+            self.assertEqual(self.client.get(url).status_code, 404, url)
+
+    def test_cached_until_posts_change(self):
+        self.section('posts-en')
+        request = RequestFactory().get('/')
+        with self.assertNumQueries(0):
+            sitemap_section(request, 'posts-en', '1')
+
+        post = Post._base_manager.get(pk='draft')
+        post.published = True
+        post.save()
+
+        self.assertIn('draft', self.section('posts-en'))
@@ -0,0 +1,27 @@
+from django.core.exceptions import ValidationError
+from django.test import SimpleTestCase
+
+from djangoplicity.blog.validators import check_template, checked_templates, validate_string_template
+
+
+class TestCheckTemplate(SimpleTestCase):
+    def setUp(self):
+        checked_templates.clear()
+
+    def test_valid(self):
+        self.assertIsNone(check_template('<p>{{ value }}</p>'))
+        validate_string_template('<p>{{ value }}</p>')
+
+    def test_error(self):
+        error = check_template('<p>First</p>\n<p>{% if %}</p>')
+
+        self.assertEqual(error['line'], 2)
+        self.assertEqual(error['token'], '{% if %}')
+        with self.assertRaises(ValidationError):
+            validate_string_template('<p>First</p>\n<p>{% if %}</p>')
+
+    def test_memoized(self):
+        check_template('{% bogus %}')
+        check_template('{% bogus %}')
+
+        self.assertEqual(checked_templates.stats()['hits'], 1)
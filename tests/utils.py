@@ -0,0 +1,60 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from djangoplicity.media.models import Image
+
+from djangoplicity.blog.cache import body_templates
+from djangoplicity.blog.models import AuthorDescription, Category, Post
+
+
+@override_settings(BLOG_STATIC_FEED=False)
+class BlogTestCase(TestCase):
+    '''
+    Starts from empty caches, with the banner and category the posts need
+    '''
+    def setUp(self):
+        cache.clear()
+        body_templates.clear()
+        self.now = timezone.now()
+        self.banner = Image.objects.create(id='blog-banner', title='Banner')
+        self.category = Category.objects.create(name='News', slug='news')
+
+    def post(self, slug, title=None, days=1, **kwargs):
+        '''
+        Returns an unsaved public post released the given number of days
+        ago, the fields can be overridden
+        '''
+        title = title or slug.replace('-', ' ').capitalize()
+        fields = {
+            'slug': slug,
+            'lang': 'en',
+            'title': title,
+            'lede': title,
+            'body': '<p>%s</p>' % title,
+            'rendered_body': '<p>%s</p>' % title,
+            'banner': self.banner,
+            'category': self.category,
+            'published': True,
+            'release_date': self.now - timedelta(days=days),
+        }
+        fields.update(kwargs)
+        return Post(**fields)
+
+    def create_posts(self, posts, tags=None, authors=None):
+        '''
+        Bulk creates the posts without sending the signals, with the tags
+        and authors of the given dicts of slug: list
+        '''
+        Post._base_manager.bulk_create(posts)
+        Post.tags.through.objects.bulk_create([
+            Post.tags.through(post_id=slug, tag_id=tag.pk)
+            for slug, post_tags in (tags or {}).items() for tag in post_tags
+        ])
+        AuthorDescription.objects.bulk_create([
+            AuthorDescription(post_id=slug, author=author, description='Description of %s' % author.name)
+            for slug, post_authors in (authors or {}).items() for author in post_authors
+        ])
+        return posts